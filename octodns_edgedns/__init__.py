@@ -1,28 +1,305 @@
 #
 #
 #
-from collections import defaultdict
+import tracemalloc
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from json import dumps
 from logging import getLogger
+from threading import Condition, Lock
+from time import monotonic, perf_counter, sleep
+from types import MappingProxyType
 from urllib.parse import urljoin
 
 from akamai.edgegrid import EdgeGridAuth
 from requests import Session
+from requests.adapters import HTTPAdapter
 
 from octodns import __VERSION__ as octodns_version
 from octodns.provider import ProviderException
 from octodns.provider.base import BaseProvider
-from octodns.record import Record
+from octodns.record import Delete, Record
+
+from .progress import JsonLinesProgressSink, LogProgressSink, ProgressTracker
+from .zonefile import render_zone_file, zone_file_recordsets
 
 # TODO: remove __VERSION__ with the next major version release
 __version__ = __VERSION__ = '1.1.0'
 
 
+def _bytes_sent(response):
+    body = response.request.body
+    return len(body) if body else 0
+
+
 class AkamaiClientNotFound(ProviderException):
     def __init__(self, resp):
         message = "404: Resource not found"
         super().__init__(message)
 
 
+class AdaptiveLimiter(object):
+    '''
+    Additive-increase/multiplicative-decrease limit on in-flight requests
+
+    The limit grows by roughly `increase` for every `limit` requests that
+    complete with stable latency and is multiplied by `decrease` when a
+    request is throttled or its latency exceeds `latency_tolerance` times the
+    smoothed baseline for its endpoint. Baselines are kept per endpoint since
+    e.g. downloading a large zone's recordsets normally takes far longer than
+    creating a record. Requests that started before the most recent decrease
+    don't trigger another one, so a single congestion event only backs off
+    once.
+
+    Only requests sent while at least half the limit was in use grow it, so
+    that it reflects concurrency that's actually been tried rather than
+    climbing to `max_limit` on serial traffic.
+    '''
+
+    def __init__(
+        self,
+        min_limit=1,
+        max_limit=16,
+        increase=1,
+        decrease=0.5,
+        latency_tolerance=2.0,
+        smoothing=0.1,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+
+        self.limit = float(min_limit)
+        self.in_flight = 0
+        self.baselines = {}
+        self._last_decrease = None
+        self._cond = Condition()
+
+    def acquire(self):
+        """blocks until a request may be sent, returns a ticket, when it
+        started and how many were in flight, which must be passed back to
+        release
+        """
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            return monotonic(), self.in_flight
+
+    def release(self, ticket, throttled=False, endpoint=None, latency=True):
+        """`latency` False leaves the request out of spike detection, for
+        endpoints whose latency depends on the size of what's transferred
+        """
+        started, in_flight = ticket
+        with self._cond:
+            self.in_flight -= 1
+            elapsed = monotonic() - started
+
+            baseline = self.baselines.get(endpoint) if latency else None
+            spiked = (
+                baseline is not None
+                and elapsed > baseline * self.latency_tolerance
+            )
+            if throttled or spiked:
+                if self._last_decrease is None or started > self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = monotonic()
+            elif in_flight >= self.limit / 2:
+                self.limit = min(
+                    self.max_limit, self.limit + self.increase / self.limit
+                )
+
+            if latency and not throttled:
+                if baseline is None:
+                    baseline = elapsed
+                else:
+                    baseline += self.smoothing * (elapsed - baseline)
+                self.baselines[endpoint] = baseline
+
+            self._cond.notify_all()
+
+
+class PopulateProfile(object):
+    '''
+    Time and memory spent populating a zone, broken down by phase and record
+    type
+
+    Phases are `download`, fetching the recordsets, `parse`, turning rdata
+    into octoDNS data with the `_data_for_*` methods, and `record`, building
+    and adding the records with `Record.new` and `zone.add_record`.
+
+    With `memory` the memory retained by each is recorded too, the net change
+    in what tracemalloc sees as allocated. That's not what was allocated,
+    memory freed within a phase cancels out and collection can make it
+    negative, and it's process wide, so concurrent work will show up in the
+    numbers. Tracing also slows allocation heavy code down considerably, which
+    skews the timings, so it's opt-in. Without it retained is None.
+    '''
+
+    PHASES = ('download', 'parse', 'record')
+
+    # tracemalloc is global, track how many profiles are using it so that we
+    # only stop it once the last one is done and never stop tracing someone
+    # else started
+    _tracing = 0
+    _tracing_lock = Lock()
+    _tracing_ours = False
+
+    def __init__(self, zone_name, memory=False):
+        self.zone_name = zone_name
+        self.memory = memory
+        self.phases = {p: [0, 0.0, 0] for p in self.PHASES}
+        self.types = defaultdict(lambda: {p: [0, 0.0, 0] for p in self.PHASES})
+
+    def start(self):
+        if not self.memory:
+            return
+        cls = PopulateProfile
+        with cls._tracing_lock:
+            if cls._tracing == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                cls._tracing_ours = True
+            cls._tracing += 1
+
+    def stop(self):
+        if not self.memory:
+            return
+        cls = PopulateProfile
+        with cls._tracing_lock:
+            cls._tracing -= 1
+            if cls._tracing == 0 and cls._tracing_ours:
+                tracemalloc.stop()
+                cls._tracing_ours = False
+
+    def _traced(self):
+        return tracemalloc.get_traced_memory()[0] if self.memory else 0
+
+    def mark(self):
+        return perf_counter(), self._traced()
+
+    def add(self, phase, mark, _type=None, count=1):
+        seconds = perf_counter() - mark[0]
+        retained = self._traced() - mark[1]
+        totals = self.phases[phase]
+        totals[0] += count
+        totals[1] += seconds
+        totals[2] += retained
+        if _type is not None:
+            totals = self.types[_type][phase]
+            totals[0] += count
+            totals[1] += seconds
+            totals[2] += retained
+
+    def breakdown(self):
+        def _phases(phases):
+            return {
+                phase: {
+                    'count': c,
+                    'seconds': s,
+                    'retained': r if self.memory else None,
+                }
+                for phase, (c, s, r) in phases.items()
+            }
+
+        return {
+            'zone': self.zone_name,
+            'phases': _phases(self.phases),
+            'types': {
+                _type: _phases(phases)
+                for _type, phases in sorted(self.types.items())
+            },
+        }
+
+    def lines(self):
+        def _bytes(retained, fmt):
+            return fmt.format(retained) if self.memory else ''
+
+        c, s, r = self.phases['download']
+        yield (
+            f'download: {c} recordsets, {s:.3f}s'
+            f'{_bytes(r, ", {} bytes retained")}'
+        )
+        for _type, phases in sorted(self.types.items()):
+            c, ps, pr = phases['parse']
+            _, rs, rr = phases['record']
+            yield (
+                f'{_type}: {c} records, '
+                f'{ps:.3f}s parse{_bytes(pr, " ({} bytes retained)")}, '
+                f'{rs:.3f}s Record.new{_bytes(rr, " ({} bytes retained)")}'
+            )
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class RdataCache(object):
+    '''
+    Bounded LRU of parsed values keyed by record type and rdata
+
+    The same rdata turns up again and again across zones, MX sets, CAA
+    policies, SPF TXTs, etc. Values are stored frozen, dicts as
+    MappingProxyTypes and lists as tuples, and callers build fresh copies
+    from them, see `_freeze` and `_thaw`.
+    '''
+
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                values = self._values[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._values.move_to_end(key)
+            self.hits += 1
+            return values
+
+    def set(self, key, values):
+        with self._lock:
+            self._values[key] = values
+            self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._values),
+                'maxsize': self.maxsize,
+            }
+
+
 class AkamaiClient(object):
     '''
     Client for making calls to Akamai Fast DNS API using Python Requests
@@ -35,8 +312,40 @@ class AkamaiClient(object):
 
     '''
 
+    # Process-wide registry of clients, keyed by host and credentials, so
+    # that providers pointed at the same account share a single session and
+    # its connection pool
+    _shared = {}
+    _shared_lock = Lock()
+
+    # Status codes that indicate we're being asked to slow down, these are
+    # retried after backing off
+    THROTTLED_STATUSES = (429, 503)
+
+    # A 503 may come from a gateway after the backend has acted on the
+    # request, so only those that are safe to repeat are retried on one. 429s
+    # are always rejected up front and retried regardless
+    IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE')
+
+    # Whole zone transfers take as long as the zone is big, so their latency
+    # says nothing about congestion
+    ZONE_SIZED_ENDPOINTS = (
+        'zone_file_get',
+        'zone_file_post',
+        'zone_recordset_get',
+        'zones_list',
+    )
+
     def __init__(
-        self, client_secret, host, access_token, client_token, comment
+        self,
+        client_secret,
+        host,
+        access_token,
+        client_token,
+        comment=None,
+        max_concurrency=16,
+        retries=3,
+        retry_backoff=1,
     ):
         self.base = "https://" + host + "/config-dns/v2/"
 
@@ -52,11 +361,94 @@ class AkamaiClient(object):
             access_token=access_token,
         )
         self._sess = sess
+        self._mount(max_concurrency)
         self.comment = comment
+        self.limiter = AdaptiveLimiter(max_limit=max_concurrency)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+
+    @classmethod
+    def shared(
+        cls, client_secret, host, access_token, client_token, max_concurrency=16
+    ):
+        """returns the client for host and credentials, creating it the first
+        time they're seen. The most conservative max_concurrency requested
+        applies to everyone sharing the client
+        """
+        key = (host, client_secret, access_token, client_token)
+        with cls._shared_lock:
+            try:
+                client = cls._shared[key]
+            except KeyError:
+                client = cls(
+                    client_secret,
+                    host,
+                    access_token,
+                    client_token,
+                    max_concurrency=max_concurrency,
+                )
+                cls._shared[key] = client
+            if max_concurrency < client.limiter.max_limit:
+                client.limiter.max_limit = max_concurrency
+                client._mount(max_concurrency)
+            return client
+
+    def _mount(self, max_concurrency):
+        # pool as many connections as may be in flight, otherwise those over
+        # the default of 10 are discarded and have to be re-established
+        self._sess.mount('https://', HTTPAdapter(pool_maxsize=max_concurrency))
+
+    def _retry_after(self, resp, attempt):
+        try:
+            return float(resp.headers['Retry-After'])
+        except (KeyError, ValueError):
+            return self.retry_backoff * 2 ** (attempt - 1)
 
-    def _request(self, method, path, params=None, data=None, v1=False):
+    def _request(
+        self,
+        method,
+        path,
+        params=None,
+        data=None,
+        v1=False,
+        headers=None,
+        stream=False,
+        body=None,
+        endpoint=None,
+    ):
         url = urljoin(self.base, path)
-        resp = self._sess.request(method, url, params=params, json=data)
+        latency = endpoint not in self.ZONE_SIZED_ENDPOINTS
+
+        attempt = 0
+        while True:
+            ticket = self.limiter.acquire()
+            # anything that goes wrong before we get a response is treated as
+            # congestion
+            throttled = True
+            try:
+                resp = self._sess.request(
+                    method,
+                    url,
+                    params=params,
+                    json=data,
+                    data=body,
+                    headers=headers,
+                    stream=stream,
+                )
+                throttled = resp.status_code in self.THROTTLED_STATUSES
+            finally:
+                self.limiter.release(ticket, throttled, endpoint, latency)
+
+            retry = throttled and (
+                resp.status_code == 429 or method in self.IDEMPOTENT_METHODS
+            )
+            if not retry or attempt >= self.retries:
+                break
+            attempt += 1
+            # we're not going to read this one, let the connection go back to
+            # the pool
+            resp.close()
+            sleep(self._retry_after(resp, attempt))
 
         if resp.status_code == 404:
             raise AkamaiClientNotFound(resp)
@@ -66,25 +458,55 @@ class AkamaiClient(object):
 
     def record_create(self, zone, name, record_type, content):
         path = f'zones/{zone}/names/{name}/types/{record_type}'
-        result = self._request('POST', path, data=content)
+        result = self._request(
+            'POST', path, data=content, endpoint='record_create'
+        )
 
         return result
 
     def record_delete(self, zone, name, record_type):
         path = f'zones/{zone}/names/{name}/types/{record_type}'
-        result = self._request('DELETE', path)
+        result = self._request('DELETE', path, endpoint='record_delete')
 
         return result
 
     def record_replace(self, zone, name, record_type, content):
         path = f'zones/{zone}/names/{name}/types/{record_type}'
-        result = self._request('PUT', path, data=content)
+        result = self._request(
+            'PUT', path, data=content, endpoint='record_replace'
+        )
 
         return result
 
     def zone_get(self, zone):
         path = f'zones/{zone}'
-        result = self._request('GET', path)
+        result = self._request('GET', path, endpoint='zone_get')
+
+        return result
+
+    def zone_file_get(self, zone):
+        path = f'zones/{zone}/zone-file'
+        # streamed, so this only sees the time to the headers, which is
+        # fine as it's only compared with other zone file downloads
+        result = self._request(
+            'GET',
+            path,
+            headers={'Accept': 'text/dns'},
+            stream=True,
+            endpoint='zone_file_get',
+        )
+
+        return result
+
+    def zone_file_post(self, zone, content):
+        path = f'zones/{zone}/zone-file'
+        result = self._request(
+            'POST',
+            path,
+            headers={'Content-Type': 'text/dns'},
+            body=content.encode('utf-8'),
+            endpoint='zone_file_post',
+        )
 
         return result
 
@@ -94,25 +516,59 @@ class AkamaiClient(object):
         if gid is not None:
             path += f'&gid={gid}'
 
-        result = self._request('POST', path, data=params)
+        result = self._request(
+            'POST', path, data=params, endpoint='zone_create'
+        )
 
         return result
 
     def zone_changelist_create(self, zone):
         path = f'changelists?zone={zone}'
-        result = self._request('POST', path, data={})
+        result = self._request(
+            'POST', path, data={}, endpoint='zone_changelist_create'
+        )
 
         return result
 
-    def zone_changelist_submit(self, zone):
+    def zone_changelist_submit(self, zone, comment=None):
         path = f'changelists/{zone}/submit'
 
+        if comment is None:
+            comment = self.comment
+
         result = self._request(
-            'POST', path, data={}, params={"comment": self.comment}
+            'POST',
+            path,
+            data={},
+            params={"comment": comment},
+            endpoint='zone_changelist_submit',
         )
 
         return result
 
+    def zones_list(self, contractIds=None, pageSize=1000):
+        """yields the zones visible to the credentials, a page at a time"""
+        page = 1
+        while True:
+            params = {
+                'contractIds': contractIds,
+                'page': page,
+                'pageSize': pageSize,
+                'showAll': 'false',
+                'sortBy': 'zone',
+            }
+            result = self._request(
+                'GET', 'zones', params=params, endpoint='zones_list'
+            ).json()
+
+            zones = result.get('zones', [])
+            yield from zones
+
+            total = result.get('metadata', {}).get('totalElements', 0)
+            if not zones or page * pageSize >= total:
+                break
+            page += 1
+
     def zone_recordset_get(
         self,
         zone,
@@ -133,7 +589,9 @@ class AkamaiClient(object):
         }
 
         path = f'zones/{zone}/recordsets'
-        result = self._request('GET', path, params=params)
+        result = self._request(
+            'GET', path, params=params, endpoint='zone_recordset_get'
+        )
 
         return result
 
@@ -164,6 +622,27 @@ class AkamaiProvider(BaseProvider):
         )
     )
 
+    # Types whose rdata parsing is worth caching, the others are little more
+    # than a copy of the rdata
+    RDATA_CACHE_TYPES = set(
+        (
+            'CAA',
+            'DS',
+            'HTTPS',
+            'LOC',
+            'MX',
+            'NAPTR',
+            'SRV',
+            'SSHFP',
+            'SVCB',
+            'TLSA',
+            'TXT',
+        )
+    )
+
+    # Shared by every provider in the process
+    rdata_cache = RdataCache()
+
     def __init__(
         self,
         id,
@@ -174,6 +653,17 @@ class AkamaiProvider(BaseProvider):
         contract_id=None,
         gid=None,
         comment=None,
+        max_concurrency=16,
+        profile_populate=False,
+        zone_file=False,
+        zone_file_threshold=None,
+        list_zones=False,
+        missing_zone_ttl=10,
+        progress_interval=None,
+        progress_file=None,
+        trusted_source=False,
+        rdata_cache=False,
+        profile_populate_memory=False,
         *args,
         **kwargs,
     ):
@@ -181,34 +671,217 @@ class AkamaiProvider(BaseProvider):
         self.log.debug('__init__: id=%s, ')
         super().__init__(id, *args, **kwargs)
 
-        self._dns_client = AkamaiClient(
-            client_secret, host, access_token, client_token, comment
+        self._dns_client = AkamaiClient.shared(
+            client_secret,
+            host,
+            access_token,
+            client_token,
+            max_concurrency=max_concurrency,
         )
 
         self._zone_records = {}
+        self._zone_records_lock = Lock()
+        self._zone_fetches = {}
+        self._zone_missing = {}
+        self._missing_zone_ttl = missing_zone_ttl
+        self._comment = comment
+        self._profile_populate = profile_populate
+        self._profile_populate_memory = profile_populate_memory
+        self._trusted_source = trusted_source
+        # zone name to the lenient populate was called with when it skipped
+        # validation
+        self._trusted_lenient = {}
+        self._use_rdata_cache = rdata_cache
+        self._zone_file = zone_file
+        if zone_file_threshold is not None and (
+            isinstance(zone_file_threshold, bool)
+            or not isinstance(zone_file_threshold, (int, float))
+            or not 0 <= zone_file_threshold <= 1
+        ):
+            raise ProviderException(
+                f'{id}: zone_file_threshold must be a number between 0 and 1, '
+                f'got {zone_file_threshold!r}'
+            )
+        self._zone_file_threshold = zone_file_threshold
+        self._list_zones = list_zones
+        self._zone_index = None
+        self._zone_index_lock = Lock()
+
+        # callables that are passed progress event dicts during apply, see
+        # ProgressTracker
+        self.progress_sinks = []
+        if progress_interval is not None:
+            self.progress_sinks.append(
+                LogProgressSink(self.log, progress_interval)
+            )
+        if progress_file is not None:
+            self.progress_sinks.append(JsonLinesProgressSink(progress_file))
         self._contractId = contract_id
         self._gid = gid
 
+    @property
+    def zone_index(self):
+        """zone name, with trailing dot, to zone metadata for everything
+        visible to the contract, listed once and then kept for the run
+        """
+        with self._zone_index_lock:
+            if self._zone_index is None:
+                self.log.debug('zone_index: listing zones')
+                self._zone_index = {
+                    f'{z["zone"]}.': z
+                    for z in self._dns_client.zones_list(self._contractId)
+                }
+                self.log.info(
+                    'zone_index:   found %d zones', len(self._zone_index)
+                )
+            return self._zone_index
+
+    def list_zones(self):
+        return sorted(self.zone_index.keys())
+
+    def _zone_exists(self, name):
+        """True or False when we know if the zone exists, None when we'd have
+        to look
+        """
+        if not self._list_zones:
+            return None
+        return name in self.zone_index
+
     def zone_records(self, zone):
         """returns records for a zone, looks for it if not present, or
         returns empty [] if can't find a match
+
+        Concurrent callers for the same zone share a single fetch and zones
+        that don't exist are remembered for missing_zone_ttl seconds
         """
-        if zone.name not in self._zone_records:
+        name = zone.name
+        with self._zone_records_lock:
             try:
-                name = zone.name[:-1]
-                response = self._dns_client.zone_recordset_get(name)
-                self._zone_records[zone.name] = response.json()["recordsets"]
+                return self._zone_records[name]
+            except KeyError:
+                pass
+            expires = self._zone_missing.get(name)
+            if expires is not None:
+                if monotonic() < expires:
+                    return []
+                del self._zone_missing[name]
+            fetch = self._zone_fetches.get(name)
+            if fetch is not None:
+                waiting = True
+            else:
+                waiting = False
+                fetch = self._zone_fetches[name] = Future()
+
+        if waiting:
+            self.log.debug('zone_records: waiting on fetch, zone=%s', name)
+            return fetch.result()
 
-            except (AkamaiClientNotFound, KeyError):
-                return []
-
-        return self._zone_records[zone.name]
+        try:
+            recordsets = self._fetch_zone_records(zone)
+        except BaseException as e:
+            with self._zone_records_lock:
+                del self._zone_fetches[name]
+            fetch.set_exception(e)
+            raise
+
+        with self._zone_records_lock:
+            del self._zone_fetches[name]
+            if recordsets is None:
+                self._zone_missing[name] = monotonic() + self._missing_zone_ttl
+                recordsets = []
+            else:
+                self._zone_records[name] = recordsets
+        fetch.set_result(recordsets)
+
+        return recordsets
+
+    def _fetch_zone_records(self, zone):
+        """returns the recordsets for a zone or None if it doesn't exist"""
+        if self._zone_exists(zone.name) is False:
+            return None
+        try:
+            name = zone.name[:-1]
+            if self._zone_file:
+                return self._zone_file_records(name)
+            response = self._dns_client.zone_recordset_get(name)
+            return response.json()["recordsets"]
+        except (AkamaiClientNotFound, KeyError):
+            return None
+
+    def _forget_zone(self, name):
+        """drops anything cached about a zone, found or missing"""
+        with self._zone_records_lock:
+            self._zone_records.pop(name, None)
+            self._zone_missing.pop(name, None)
+
+    def _zone_file_records(self, name):
+        with self._dns_client.zone_file_get(name) as response:
+            lines = (line.decode('utf-8') for line in response.iter_lines())
+            return zone_file_recordsets(lines, name)
 
     def populate(self, zone, target=False, lenient=False):
         self.log.debug('populate: name=%s', zone.name)
 
+        # only targets get to skip validation, the records that matter are
+        # validated in _include_change with the same leniency
+        trusted = self._trusted_source and target
+        if trusted:
+            self._trusted_lenient[zone.name] = lenient
+
+        before = len(zone.records)
+        if self._profile_populate:
+            self._populate_profiled(zone, lenient, trusted)
+        else:
+            values = self._group_recordsets(zone, self.zone_records(zone))
+            for name, types in values.items():
+                for _type, records in types.items():
+                    data = self._data_for(_type, records[0])
+                    self._add_record(zone, name, data, lenient, trusted)
+
+        exists = zone.name in self._zone_records
+        found = len(zone.records) - before
+        self.log.info('populate:   found %s records, exists=%s', found, exists)
+        if self._use_rdata_cache:
+            self.log.debug(
+                'populate:   rdata cache %s', self.rdata_cache.stats()
+            )
+
+        return exists
+
+    def _populate_profiled(self, zone, lenient, trusted):
+        profile = PopulateProfile(
+            zone.name, memory=self._profile_populate_memory
+        )
+        profile.start()
+        try:
+            mark = profile.mark()
+            recordsets = self.zone_records(zone)
+            profile.add('download', mark, count=len(recordsets))
+
+            values = self._group_recordsets(zone, recordsets)
+            for name, types in values.items():
+                for _type, records in types.items():
+                    mark = profile.mark()
+                    data = self._data_for(_type, records[0])
+                    profile.add('parse', mark, _type)
+
+                    mark = profile.mark()
+                    self._add_record(zone, name, data, lenient, trusted)
+                    profile.add('record', mark, _type)
+        finally:
+            profile.stop()
+
+        for line in profile.lines():
+            self.log.info('populate:   profile %s', line)
+
+        if isinstance(self._profile_populate, str):
+            with open(self._profile_populate, 'a') as fh:
+                fh.write(dumps(profile.breakdown()))
+                fh.write('\n')
+
+    def _group_recordsets(self, zone, recordsets):
         values = defaultdict(lambda: defaultdict(list))
-        for record in self.zone_records(zone):
+        for record in recordsets:
             _type = record.get('type')
             # Akamai sends down prefix.zonename., while octodns expects prefix
             _name = record.get('name').split("." + zone.name[:-1], 1)[0]
@@ -219,24 +892,48 @@ class AkamaiProvider(BaseProvider):
                 continue
             values[_name][_type].append(record)
 
-        before = len(zone.records)
-        for name, types in values.items():
-            for _type, records in types.items():
-                data_for = getattr(self, f'_data_for_{_type}')
-                record = Record.new(
-                    zone,
-                    name,
-                    data_for(_type, records[0]),
-                    source=self,
-                    lenient=lenient,
-                )
-                zone.add_record(record, lenient=lenient)
-
-        exists = zone.name in self._zone_records
-        found = len(zone.records) - before
-        self.log.info('populate:   found %s records, exists=%s', found, exists)
+        return values
 
-        return exists
+    def _data_for(self, _type, records):
+        data_for = getattr(self, f'_data_for_{_type}')
+        if not self._use_rdata_cache or _type not in self.RDATA_CACHE_TYPES:
+            return data_for(_type, records)
+
+        key = (_type, tuple(records['rdata']))
+        values = self.rdata_cache.get(key)
+        if values is None:
+            values = _freeze(data_for(_type, records)['values'])
+            self.rdata_cache.set(key, values)
+
+        return {'ttl': records['ttl'], 'type': _type, 'values': _thaw(values)}
+
+    def _add_record(self, zone, name, data, lenient, trusted):
+        if trusted:
+            # Akamai has already accepted this data, skip straight to building
+            # the record, see _include_change
+            _class = Record.registered_types()[data['type']]
+            record = _class(zone, name, data, source=self)
+        else:
+            record = Record.new(zone, name, data, source=self, lenient=lenient)
+        zone.add_record(record, lenient=lenient)
+
+    def _include_change(self, change):
+        existing = change.existing
+        if self._trusted_source and existing is not None:
+            # validate records we skipped validating in populate now that
+            # they're part of a change, as leniently as populate was asked to
+            lenient = self._trusted_lenient.get(existing.zone.name, False)
+            self.log.debug(
+                '_include_change: validating %s %s, lenient=%s',
+                existing.fqdn,
+                existing._type,
+                lenient,
+            )
+            data = dict(existing.data, type=existing._type)
+            Record.new(
+                existing.zone, existing.name, data, source=self, lenient=lenient
+            )
+        return super()._include_change(change)
 
     def _apply(self, plan):
         desired = plan.desired
@@ -244,10 +941,15 @@ class AkamaiProvider(BaseProvider):
         self.log.debug('apply: zone=%s, chnges=%d', desired.name, len(changes))
 
         zone_name = desired.name[:-1]
-        try:
-            self._dns_client.zone_get(zone_name)
+        exists = self._zone_exists(desired.name)
+        if exists is None:
+            try:
+                self._dns_client.zone_get(zone_name)
+                exists = True
+            except AkamaiClientNotFound:
+                exists = False
 
-        except AkamaiClientNotFound:
+        if not exists:
             self.log.info("zone not found, creating zone")
             params = self._build_zone_config(zone_name)
             self._dns_client.zone_create(self._contractId, params, self._gid)
@@ -255,68 +957,138 @@ class AkamaiProvider(BaseProvider):
                 "zone created, generating SOA and NS records (required)."
             )
             self._dns_client.zone_changelist_create(zone_name)
-            self._dns_client.zone_changelist_submit(zone_name)
-
-        for change in changes:
-            class_name = change.__class__.__name__
-            getattr(self, f'_apply_{class_name}')(change)
+            self._dns_client.zone_changelist_submit(zone_name, self._comment)
+            if self._list_zones:
+                self.zone_index[desired.name] = params
+            # it exists now
+            self._forget_zone(desired.name)
+
+        progress = ProgressTracker(
+            desired.name, len(changes), self.progress_sinks
+        )
+        progress.start()
+        try:
+            if self._use_zone_file_upload(plan):
+                result = self._apply_zone_file(desired, changes)
+                progress.batch(len(changes), _bytes_sent(result))
+            else:
+                for change in changes:
+                    class_name = change.__class__.__name__
+                    result = getattr(self, f'_apply_{class_name}')(change)
+                    progress.change(change, _bytes_sent(result))
+        except Exception as e:
+            progress.fail(e)
+            raise
+        else:
+            progress.finish()
+        finally:
+            progress.close()
 
         # Clear out the cache if any
-        self._zone_records.pop(desired.name, None)
+        self._forget_zone(desired.name)
+
+    def _use_zone_file_upload(self, plan):
+        if self._zone_file_threshold is None:
+            return False
+        # records are keyed on name and type so this counts each one once
+        # whether it's being created, updated or deleted
+        size = len(plan.desired.records | plan.existing.records)
+        fraction = len(plan.changes) / size
+        self.log.debug(
+            'apply:   changed fraction=%.3f, threshold=%.3f',
+            fraction,
+            self._zone_file_threshold,
+        )
+        if fraction <= self._zone_file_threshold:
+            return False
+
+        # the upload replaces the zone with what's there now plus the changes,
+        # if what's there now didn't come back, e.g. the zone's cached as
+        # missing, that would drop the SOA and NS records
+        recordsets = self.zone_records(plan.desired)
+        if not any(r['type'] == 'SOA' for r in recordsets):
+            self.log.warning(
+                'apply:   no SOA in the current records of zone=%s, applying '
+                'changes one at a time rather than uploading a zone file',
+                plan.desired.name,
+            )
+            return False
+        return True
 
     def _apply_Create(self, change):
         new = change.new
-        record_type = new._type
-
-        params_for = getattr(self, f'_params_for_{record_type}')
-        values = self._get_values(new.data)
-        rdata = params_for(values)
-
         zone = new.zone.name[:-1]
-        name = self._set_full_name(new.name, zone)
+        content = self._content_for(new)
 
-        content = {
-            "name": name,
-            "type": record_type,
-            "ttl": new.ttl,
-            "rdata": rdata,
-        }
-
-        self._dns_client.record_create(zone, name, record_type, content)
-
-        return
+        return self._dns_client.record_create(
+            zone, content['name'], new._type, content
+        )
 
     def _apply_Delete(self, change):
         zone = change.existing.zone.name[:-1]
         name = self._set_full_name(change.existing.name, zone)
         record_type = change.existing._type
 
-        self._dns_client.record_delete(zone, name, record_type)
-
-        return
+        return self._dns_client.record_delete(zone, name, record_type)
 
     def _apply_Update(self, change):
         new = change.new
-        record_type = new._type
+        zone = new.zone.name[:-1]
+        content = self._content_for(new)
+
+        return self._dns_client.record_replace(
+            zone, content['name'], new._type, content
+        )
+
+    def _apply_zone_file(self, desired, changes):
+        zone_name = desired.name[:-1]
+
+        # start from what's there now, which includes the SOA and anything
+        # else we don't manage, and apply the changes to it
+        recordsets = {
+            (r['name'], r['type']): r for r in self.zone_records(desired)
+        }
+        for change in changes:
+            if isinstance(change, Delete):
+                existing = change.existing
+                name = self._set_full_name(existing.name, zone_name)
+                recordsets.pop((name, existing._type), None)
+            else:
+                new = change.new
+                content = self._content_for(new)
+                if new._type in ('SPF', 'TXT'):
+                    # a master file's character-strings can't be over 255
+                    # bytes, the API splits them up for us, here we have to.
+                    # ;s are quoted so, as with _params_for_TXT, don't need
+                    # escaping
+                    content['rdata'] = [
+                        v.replace('\\;', ';') for v in new.chunked_values
+                    ]
+                recordsets[(content['name'], content['type'])] = content
+
+        self.log.info(
+            'apply:   uploading zone file, recordsets=%d', len(recordsets)
+        )
+        content = ''.join(render_zone_file(recordsets.values()))
+        return self._dns_client.zone_file_post(zone_name, content)
+
+    def _content_for(self, record):
+        record_type = record._type
 
         params_for = getattr(self, f'_params_for_{record_type}')
-        values = self._get_values(new.data)
+        values = self._get_values(record.data)
         rdata = params_for(values)
 
-        zone = new.zone.name[:-1]
-        name = self._set_full_name(new.name, zone)
+        zone = record.zone.name[:-1]
+        name = self._set_full_name(record.name, zone)
 
-        content = {
+        return {
             "name": name,
             "type": record_type,
-            "ttl": new.ttl,
+            "ttl": record.ttl,
             "rdata": rdata,
         }
 
-        self._dns_client.record_replace(zone, name, record_type, content)
-
-        return
-
     def _data_for_multiple(self, _type, records):
         return {
             'ttl': records['ttl'],
@@ -526,7 +1298,9 @@ class AkamaiProvider(BaseProvider):
             flags = r['flags']
             tag = r['tag']
             value = r['value']
-            rdata.append(f'{flags} {tag} {value}')
+            # quoted to match what _data_for_CAA expects back and so values
+            # with spaces or ;s survive in zone files
+            rdata.append(f'{flags} {tag} "{value}"')
 
         return rdata
 
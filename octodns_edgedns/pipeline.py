@@ -0,0 +1,111 @@
+#
+#
+#
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+
+class AkamaiPipeline(object):
+    '''
+    Syncs a series of zones to an AkamaiProvider, overlapping the network
+    and CPU bound stages rather than running them back to back
+
+    While zone N is being planned the recordsets of the next `lookahead`
+    zones are downloaded in the background and zone N-1's changes are
+    applied. Only the zones in that window have their recordsets held in
+    memory, so `lookahead`, which must be at least 1, bounds memory as well as
+    prefetching. Results are handed back as each zone is done rather than
+    collected, so a long run doesn't hold on to every plan either.
+
+    Zones are applied one at a time, in the order they're provided.
+
+    As with a manager sync, `processors` are passed to `plan` and their
+    `process_plan` run on the result, and unless `force` is set plans are
+    checked with `raise_if_unsafe` before they're applied.
+    '''
+
+    def __init__(self, provider, lookahead=2, processors=None, force=False):
+        if lookahead < 1:
+            raise ValueError(f'lookahead must be at least 1, got {lookahead}')
+        self.log = getLogger(f'AkamaiPipeline[{provider.id}]')
+        self.provider = provider
+        self.lookahead = lookahead
+        self.processors = processors or []
+        self.force = force
+
+    def run(self, zones):
+        '''
+        Plans and applies each of `zones`, an iterable of populated desired
+        Zones. It's consumed lazily, so it may be a generator populating them
+        from sources. Yields a (zone name, plan, applied changes) tuple for
+        each, in the same order, as its apply finishes, plan is None when
+        there was nothing to do.
+        '''
+        provider = self.provider
+        zones = iter(zones)
+        window = deque()
+
+        with (
+            ThreadPoolExecutor(
+                max_workers=self.lookahead, thread_name_prefix='edgedns-fetch'
+            ) as fetcher,
+            ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='edgedns-apply'
+            ) as applier,
+        ):
+
+            def fill():
+                # the zone about to be planned plus lookahead more
+                while len(window) < self.lookahead + 1:
+                    try:
+                        desired = next(zones)
+                    except StopIteration:
+                        return
+                    self.log.debug('run: prefetching zone=%s', desired.name)
+                    fetch = fetcher.submit(provider.zone_records, desired)
+                    window.append((desired, fetch))
+
+            applying = None
+            while True:
+                fill()
+                if not window:
+                    break
+                desired, fetch = window.popleft()
+
+                # surface download errors here, populate would otherwise just
+                # try again
+                fetch.result()
+                plan = self._plan(desired)
+
+                # applies happen in order so wait on the previous one
+                if applying is not None:
+                    yield applying.result()
+                    applying = None
+
+                if plan is None:
+                    # nothing to apply, so nothing will clear out its records
+                    provider._forget_zone(desired.name)
+                    yield desired.name, None, 0
+                else:
+                    if not self.force:
+                        plan.raise_if_unsafe()
+                    applying = applier.submit(self._apply, plan)
+
+            if applying is not None:
+                yield applying.result()
+
+    def _plan(self, desired):
+        self.log.debug('run: planning zone=%s', desired.name)
+        plan = self.provider.plan(desired, processors=self.processors)
+        for processor in self.processors:
+            plan = processor.process_plan(
+                plan, sources=[], target=self.provider
+            )
+        return plan
+
+    def _apply(self, plan):
+        name = plan.desired.name
+        self.log.debug('run: applying zone=%s', name)
+        return name, plan, self.provider.apply(plan)
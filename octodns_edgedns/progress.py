@@ -0,0 +1,172 @@
+#
+#
+#
+
+from collections import deque
+from json import dumps
+from threading import Lock
+from time import monotonic, time
+
+
+class ProgressTracker(object):
+    '''
+    Tracks progress through applying a zone's changes and emits an event
+    dict to each sink, any callable, as it goes
+
+    Every event has `event`, one of `zone-start`, `change`, `batch`,
+    `zone-done` or `zone-failed`, `zone`, `time`, `elapsed`, `done`, `total`,
+    `bytes_sent`, `ops_per_sec`, `bytes_per_sec` and `eta`, seconds remaining
+    or None when it can't be estimated yet. Rates and the ETA are over the last `window`
+    events so they follow throttling rather than averaging it away. `change`
+    events add `change`, `name` and `type`, `batch` events add `count` and
+    `zone-failed` events add `error`. `close` closes any sinks that have a
+    `close` method once the zone is over, however it ended.
+    '''
+
+    def __init__(self, zone_name, total, sinks, window=50):
+        self.zone_name = zone_name
+        self.total = total
+        self.sinks = sinks
+        self.done = 0
+        self.bytes_sent = 0
+        self.started = monotonic()
+        self._samples = deque([(self.started, 0, 0)], maxlen=window)
+
+    def start(self):
+        self._emit('zone-start')
+
+    def change(self, change, bytes_sent=0):
+        record = change.new or change.existing
+        self._advance(1, bytes_sent)
+        self._emit(
+            'change',
+            change=change.__class__.__name__,
+            name=record.name,
+            type=record._type,
+        )
+
+    def batch(self, count, bytes_sent=0):
+        self._advance(count, bytes_sent)
+        self._emit('batch', count=count)
+
+    def finish(self):
+        self._emit('zone-done')
+
+    def fail(self, error):
+        self._emit('zone-failed', error=str(error))
+
+    def close(self):
+        for sink in self.sinks:
+            close = getattr(sink, 'close', None)
+            if close is not None:
+                close()
+
+    def _advance(self, count, bytes_sent):
+        self.done += count
+        self.bytes_sent += bytes_sent
+        self._samples.append((monotonic(), self.done, self.bytes_sent))
+
+    def _emit(self, event, **extra):
+        if not self.sinks:
+            return
+
+        now, done, bytes_sent = self._samples[-1]
+        then, done_then, bytes_then = self._samples[0]
+        seconds = now - then
+        if seconds > 0:
+            ops_per_sec = (done - done_then) / seconds
+            bytes_per_sec = (bytes_sent - bytes_then) / seconds
+        else:
+            ops_per_sec = bytes_per_sec = 0.0
+        remaining = self.total - self.done
+        if remaining <= 0:
+            eta = 0.0
+        elif ops_per_sec > 0:
+            eta = remaining / ops_per_sec
+        else:
+            eta = None
+
+        data = {
+            'event': event,
+            'zone': self.zone_name,
+            'time': time(),
+            'elapsed': monotonic() - self.started,
+            'done': self.done,
+            'total': self.total,
+            'bytes_sent': self.bytes_sent,
+            'ops_per_sec': ops_per_sec,
+            'bytes_per_sec': bytes_per_sec,
+            'eta': eta,
+        }
+        data.update(extra)
+
+        for sink in self.sinks:
+            sink(data)
+
+
+class LogProgressSink(object):
+    '''
+    Logs zone and batch events as they happen and, at most every `interval`
+    seconds, the latest change event
+    '''
+
+    def __init__(self, log, interval=10):
+        self.log = log
+        self.interval = interval
+        self._next = 0
+
+    def __call__(self, event):
+        if event['event'] == 'change':
+            now = monotonic()
+            if now < self._next:
+                return
+            self._next = now + self.interval
+
+        eta = event['eta']
+        eta = 'unknown' if eta is None else f'{eta:.0f}s'
+        self.log.info(
+            'progress: %s zone=%s, %d/%d, %.1f ops/s, %d bytes sent, '
+            '%.0f bytes/s, eta=%s',
+            event['event'],
+            event['zone'],
+            event['done'],
+            event['total'],
+            event['ops_per_sec'],
+            event['bytes_sent'],
+            event['bytes_per_sec'],
+            eta,
+        )
+
+
+class JsonLinesProgressSink(object):
+    '''
+    Appends each event to `filename` as a line of JSON
+
+    The file is opened, line buffered, with the first event and closed after
+    a `zone-done` or `zone-failed`, so it's opened once per zone rather than
+    per change.
+    `close` closes it early, e.g. when an apply has failed part way through.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._fh = None
+        self._lock = Lock()
+
+    def __call__(self, event):
+        line = dumps(event)
+        with self._lock:
+            if self._fh is None:
+                self._fh = open(self.filename, 'a', buffering=1)
+            self._fh.write(f'{line}\n')
+            if event['event'] in ('zone-done', 'zone-failed'):
+                self._close()
+
+    def _close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def close(self):
+        with self._lock:
+            self._close()
@@ -0,0 +1,249 @@
+#
+#
+#
+
+from octodns.provider import ProviderException
+
+
+class ZoneFileParseError(ProviderException):
+    def __init__(self, msg, lineno):
+        super().__init__(f'{msg}, line {lineno}')
+        self.lineno = lineno
+
+
+# Classes that may appear before or after the TTL
+_CLASSES = set(('IN', 'CH', 'HS', 'CS'))
+
+# Multipliers for BIND style TTLs, e.g. 1h30m
+_TTL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+# Positions of the domain-names, if any, in rdata. In a master file names
+# without a trailing dot are relative to the origin
+_RDATA_NAMES = {
+    'CNAME': (0,),
+    'HTTPS': (1,),
+    'MX': (1,),
+    'NAPTR': (5,),
+    'NS': (0,),
+    'PTR': (0,),
+    'SOA': (0, 1),
+    'SRV': (3,),
+    'SVCB': (1,),
+}
+
+
+def _ttl(token):
+    if token.isdigit():
+        return int(token)
+    total = 0
+    digits = ''
+    for c in token.lower():
+        if c.isdigit():
+            digits += c
+        elif c in _TTL_UNITS and digits:
+            total += int(digits) * _TTL_UNITS[c]
+            digits = ''
+        else:
+            return None
+    if digits:
+        # a trailing number without units isn't valid
+        return None
+    return total
+
+
+def _tokenize(line):
+    '''
+    Splits a line into tokens, dropping comments. Quoted strings are a single
+    token, quotes included, and parentheses are tokens of their own.
+    '''
+    if '"' not in line and '\\' not in line:
+        # fast path, nothing can hide a ; or ( ) so simple splits will do
+        line = line.split(';', 1)[0]
+        if '(' in line or ')' in line:
+            line = line.replace('(', ' ( ').replace(')', ' ) ')
+        return line.split()
+
+    tokens = []
+    token = []
+    quoted = False
+    escaped = False
+    for c in line:
+        if escaped:
+            token.append(c)
+            escaped = False
+        elif c == '\\':
+            token.append(c)
+            escaped = True
+        elif quoted:
+            token.append(c)
+            if c == '"':
+                quoted = False
+        elif c == '"':
+            token.append(c)
+            quoted = True
+        elif c == ';':
+            break
+        elif c in ' \t\r\n()':
+            if token:
+                tokens.append(''.join(token))
+                token = []
+            if c in '()':
+                tokens.append(c)
+        else:
+            token.append(c)
+    if token:
+        tokens.append(''.join(token))
+    return tokens
+
+
+def _absolute(name, origin):
+    if name == '@':
+        return origin
+    if name.endswith('.'):
+        return name
+    return f'{name}.{origin}'
+
+
+def parse_zone_file(lines, origin):
+    '''
+    Parses RFC 1035 master file lines in a single pass, yielding a
+    (name, type, ttl, rdata) tuple for each resource record as it's
+    completed. Names are absolute without the trailing dot to match what the
+    recordsets API returns, rdata is the record's tokens joined with single
+    spaces.
+
+    Supports $ORIGIN, $TTL, comments, quoted strings, parentheses spanning
+    lines, blank and relative owners and TTL/class in either order.
+    '''
+    if not origin.endswith('.'):
+        origin = f'{origin}.'
+    default_ttl = None
+    last_ttl = None
+    owner = None
+
+    pending = None
+    depth = 0
+    for lineno, line in enumerate(lines, 1):
+        tokens = _tokenize(line)
+
+        if pending is None:
+            if not tokens:
+                continue
+            # a line starting with whitespace continues the previous owner
+            continues = line[0] in ' \t'
+            start = lineno
+            pending = []
+        for token in tokens:
+            if token == '(':
+                depth += 1
+            elif token == ')':
+                if depth == 0:
+                    raise ZoneFileParseError('Unbalanced parentheses', lineno)
+                depth -= 1
+            else:
+                pending.append(token)
+        if depth:
+            continue
+        tokens, pending = pending, None
+
+        if tokens[0][0] == '$':
+            directive = tokens[0].upper()
+            if directive == '$ORIGIN' and len(tokens) > 1:
+                origin = _absolute(tokens[1], origin)
+            elif directive == '$TTL' and len(tokens) > 1:
+                default_ttl = _ttl(tokens[1])
+                if default_ttl is None:
+                    raise ZoneFileParseError(
+                        f'Invalid $TTL "{tokens[1]}"', start
+                    )
+            else:
+                raise ZoneFileParseError(
+                    f'Unsupported directive "{tokens[0]}"', start
+                )
+            continue
+
+        if not continues:
+            owner = _absolute(tokens.pop(0), origin)
+        elif owner is None:
+            raise ZoneFileParseError('Record without an owner', start)
+
+        ttl = None
+        # ttl and class may come in either order, both are optional
+        for _ in range(2):
+            if not tokens:
+                break
+            if ttl is None:
+                ttl = _ttl(tokens[0])
+                if ttl is not None:
+                    tokens.pop(0)
+                    continue
+            if tokens[0].upper() in _CLASSES:
+                tokens.pop(0)
+                continue
+            break
+
+        if not tokens:
+            raise ZoneFileParseError('Record without a type', start)
+        _type = tokens.pop(0).upper()
+
+        if ttl is None:
+            ttl = default_ttl if default_ttl is not None else last_ttl
+            if ttl is None:
+                raise ZoneFileParseError('Record without a TTL', start)
+        last_ttl = ttl
+
+        for index in _RDATA_NAMES.get(_type, ()):
+            if index < len(tokens):
+                tokens[index] = _absolute(tokens[index], origin)
+
+        yield owner[:-1], _type, ttl, ' '.join(tokens)
+
+    if pending is not None:
+        raise ZoneFileParseError('Unbalanced parentheses', start)
+
+
+def zone_file_recordsets(lines, origin):
+    '''
+    Parses a zone file into the recordset dicts returned by the recordsets
+    API, `{'name', 'type', 'ttl', 'rdata'}`, in the order they're first seen.
+    '''
+    recordsets = {}
+    for name, _type, ttl, rdata in parse_zone_file(lines, origin):
+        key = (name, _type)
+        try:
+            recordsets[key]['rdata'].append(rdata)
+        except KeyError:
+            recordsets[key] = {
+                'name': name,
+                'type': _type,
+                'ttl': ttl,
+                'rdata': [rdata],
+            }
+    return list(recordsets.values())
+
+
+def _qualify(rdata, indexes):
+    tokens = _tokenize(rdata)
+    for index in indexes:
+        if index < len(tokens) and not tokens[index].endswith('.'):
+            tokens[index] = f'{tokens[index]}.'
+    return ' '.join(tokens)
+
+
+def render_zone_file(recordsets):
+    '''
+    Renders recordset dicts, as returned by the recordsets API, into master
+    file lines with absolute names.
+
+    The API returns some names in rdata, e.g. the SOA's, without the trailing
+    dot. They're fully qualified, but in a master file would be taken as
+    relative to the origin, so the dot is added.
+    '''
+    for recordset in recordsets:
+        _type = recordset['type']
+        prefix = f'{recordset["name"]}. {recordset["ttl"]} IN {_type}'
+        indexes = _RDATA_NAMES.get(_type)
+        for rdata in recordset['rdata']:
+            if indexes:
+                rdata = _qualify(rdata, indexes)
+            yield f'{prefix} {rdata}\n'
@@ -0,0 +1,251 @@
+#
+#
+#
+
+from concurrent.futures import Future
+from os.path import dirname, join
+from unittest import TestCase
+from unittest.mock import patch
+
+from requests import HTTPError
+from requests_mock import ANY
+from requests_mock import mock as requests_mock
+
+from octodns.processor.base import BaseProcessor
+from octodns.provider.plan import UnsafePlan
+from octodns.provider.yaml import YamlProvider
+from octodns.record import Record
+from octodns.zone import Zone
+
+from octodns_edgedns import AkamaiProvider
+from octodns_edgedns.pipeline import AkamaiPipeline
+
+BASE = 'https://akam.com/config-dns/v2/zones'
+
+
+class RecordingExecutor(object):
+    '''
+    Runs work as it's submitted, recording it in `events`
+    '''
+
+    events = []
+
+    def __init__(self, max_workers, thread_name_prefix):
+        self.name = thread_name_prefix
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def submit(self, fn, arg):
+        future = Future()
+        if self.name == 'edgedns-fetch':
+            self.events.append(('fetch', arg.name))
+        future.set_result(fn(arg))
+        return future
+
+
+class RecordingProcessor(BaseProcessor):
+    def __init__(self, name):
+        super().__init__(name)
+        self.existing = []
+        self.plans = []
+
+    def process_target_zone(self, existing, target, lenient=False):
+        self.existing.append(existing.name)
+        return existing
+
+    def process_plan(self, plan, sources, target):
+        self.plans.append(plan)
+        return plan
+
+
+class TestAkamaiPipeline(TestCase):
+    source = YamlProvider(
+        'test', join(dirname(__file__), 'config'), escaped_semicolons=False
+    )
+
+    def desired(self):
+        unit = Zone('unit.tests.', [])
+        self.source.populate(unit)
+        yield unit
+
+        # nothing here or there
+        yield Zone('empty.tests.', [])
+
+        small = Zone('small.tests.', [])
+        small.add_record(
+            Record.new(
+                small, 'www', {'ttl': 300, 'type': 'A', 'value': '2.2.2.2'}
+            )
+        )
+        yield small
+
+    def provider(self):
+        return AkamaiProvider(
+            "test",
+            "s",
+            "akam.com",
+            "atok",
+            "ctok",
+            "cid",
+            "gid",
+            strict_supports=False,
+        )
+
+    def test_run(self):
+        provider = self.provider()
+        # unit.tests is mostly replaced, which needs forcing
+        pipeline = AkamaiPipeline(provider, lookahead=1, force=True)
+
+        with requests_mock() as mock:
+            with open('tests/fixtures/edgedns-records-prev.json') as fh:
+                unit = mock.get(f'{BASE}/unit.tests/recordsets', text=fh.read())
+            empty = mock.get(f'{BASE}/empty.tests/recordsets', status_code=404)
+            small = mock.get(
+                f'{BASE}/small.tests/recordsets',
+                json={
+                    'recordsets': [
+                        {
+                            'name': 'www.small.tests',
+                            'type': 'A',
+                            'ttl': 300,
+                            'rdata': ['1.2.3.4'],
+                        }
+                    ]
+                },
+            )
+            mock.get(f'{BASE}/unit.tests', json={'zone': 'unit.tests'})
+            mock.get(f'{BASE}/small.tests', json={'zone': 'small.tests'})
+            mock.post(ANY, status_code=201)
+            replace = mock.put(ANY, status_code=200)
+            mock.delete(ANY, status_code=204)
+
+            results = list(pipeline.run(self.desired()))
+
+            # in order, with the plans and what was applied
+            self.assertEqual(
+                ['unit.tests.', 'empty.tests.', 'small.tests.'],
+                [r[0] for r in results],
+            )
+            self.assertEqual(35, len(results[0][1].changes))
+            self.assertEqual(35, results[0][2])
+            self.assertEqual((None, 0), results[1][1:])
+            self.assertEqual(1, results[2][2])
+            self.assertEqual(
+                {
+                    'name': 'www.small.tests',
+                    'type': 'A',
+                    'ttl': 300,
+                    'rdata': ['2.2.2.2'],
+                },
+                replace.last_request.json(),
+            )
+
+            # each zone was downloaded once, planning used the prefetch
+            self.assertEqual(1, unit.call_count)
+            self.assertEqual(1, empty.call_count)
+            self.assertEqual(1, small.call_count)
+
+        # nothing's left cached once the run is done
+        self.assertEqual({}, provider._zone_records)
+        self.assertEqual({}, provider._zone_fetches)
+
+    def test_run_window(self):
+        provider = self.provider()
+        pipeline = AkamaiPipeline(provider, lookahead=2)
+        names = [f'z{i}.tests.' for i in range(5)]
+
+        events = RecordingExecutor.events
+        events.clear()
+        plan = provider.plan
+
+        def recording_plan(desired, processors=[]):
+            events.append(('plan', desired.name))
+            return plan(desired, processors=processors)
+
+        with (
+            requests_mock() as mock,
+            patch(
+                'octodns_edgedns.pipeline.ThreadPoolExecutor', RecordingExecutor
+            ),
+            patch.object(provider, 'plan', recording_plan),
+        ):
+            mock.get(ANY, status_code=404)
+            results = list(pipeline.run(Zone(n, []) for n in names))
+
+        self.assertEqual(names, [r[0] for r in results])
+        # only the zone being planned and the next lookahead are fetched
+        self.assertEqual(
+            [
+                ('fetch', 'z0.tests.'),
+                ('fetch', 'z1.tests.'),
+                ('fetch', 'z2.tests.'),
+                ('plan', 'z0.tests.'),
+                ('fetch', 'z3.tests.'),
+                ('plan', 'z1.tests.'),
+                ('fetch', 'z4.tests.'),
+                ('plan', 'z2.tests.'),
+                ('plan', 'z3.tests.'),
+                ('plan', 'z4.tests.'),
+            ],
+            events,
+        )
+
+    def test_run_processors_and_safety(self):
+        provider = self.provider()
+        processor = RecordingProcessor('recording')
+        pipeline = AkamaiPipeline(provider, processors=[processor])
+
+        with open('tests/fixtures/edgedns-records-prev.json') as fh:
+            prev = fh.read()
+
+        # desired is empty so everything that exists would be deleted
+        with requests_mock() as mock:
+            mock.get(f'{BASE}/unit.tests/recordsets', text=prev)
+            delete = mock.delete(ANY, status_code=204)
+
+            with self.assertRaises(UnsafePlan):
+                list(pipeline.run([Zone('unit.tests.', [])]))
+            self.assertEqual(0, delete.call_count)
+
+        # processors saw the zone and the plan
+        self.assertEqual(['unit.tests.'], processor.existing)
+        self.assertEqual(1, len(processor.plans))
+        self.assertTrue(processor.plans[0].changes)
+
+        # forced plans are applied
+        provider._forget_zone('unit.tests.')
+        pipeline = AkamaiPipeline(provider, force=True)
+        with requests_mock() as mock:
+            mock.get(f'{BASE}/unit.tests/recordsets', text=prev)
+            mock.get(f'{BASE}/unit.tests', json={'zone': 'unit.tests'})
+            mock.post(ANY, status_code=201)
+            delete = mock.delete(ANY, status_code=204)
+
+            results = list(pipeline.run([Zone('unit.tests.', [])]))
+            self.assertEqual(results[0][2], delete.call_count)
+            self.assertTrue(delete.call_count)
+
+    def test_run_nothing(self):
+        pipeline = AkamaiPipeline(self.provider())
+        self.assertEqual([], list(pipeline.run([])))
+
+    def test_lookahead(self):
+        with self.assertRaises(ValueError) as ctx:
+            AkamaiPipeline(self.provider(), lookahead=0)
+        self.assertEqual(
+            'lookahead must be at least 1, got 0', str(ctx.exception)
+        )
+
+    def test_run_fetch_error(self):
+        pipeline = AkamaiPipeline(self.provider())
+
+        with requests_mock() as mock:
+            mock.get(ANY, status_code=502, text='Things caught fire')
+
+            with self.assertRaises(HTTPError) as ctx:
+                list(pipeline.run(self.desired()))
+            self.assertEqual(502, ctx.exception.response.status_code)
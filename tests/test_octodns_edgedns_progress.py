@@ -0,0 +1,194 @@
+#
+#
+#
+
+from json import loads
+from logging import getLogger
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from octodns.record import Create, Delete, Record
+from octodns.zone import Zone
+
+from octodns_edgedns.progress import (
+    JsonLinesProgressSink,
+    LogProgressSink,
+    ProgressTracker,
+)
+
+
+class TestProgressTracker(TestCase):
+    zone = Zone('unit.tests.', [])
+    record = Record.new(
+        zone, 'www', {'ttl': 60, 'type': 'A', 'value': '1.2.3.4'}
+    )
+
+    @patch('octodns_edgedns.progress.time')
+    @patch('octodns_edgedns.progress.monotonic')
+    def test_events(self, monotonic_mock, time_mock):
+        time_mock.return_value = 1234
+        monotonic_mock.return_value = 10
+        events = []
+        tracker = ProgressTracker('unit.tests.', 4, [events.append], window=3)
+
+        tracker.start()
+        self.assertEqual(
+            {
+                'event': 'zone-start',
+                'zone': 'unit.tests.',
+                'time': 1234,
+                'elapsed': 0,
+                'done': 0,
+                'total': 4,
+                'bytes_sent': 0,
+                'ops_per_sec': 0.0,
+                'bytes_per_sec': 0.0,
+                'eta': None,
+            },
+            events[-1],
+        )
+
+        monotonic_mock.return_value = 12
+        tracker.change(Create(self.record), 100)
+        event = events[-1]
+        self.assertEqual('change', event['event'])
+        self.assertEqual('Create', event['change'])
+        self.assertEqual('www', event['name'])
+        self.assertEqual('A', event['type'])
+        self.assertEqual(1, event['done'])
+        self.assertEqual(0.5, event['ops_per_sec'])
+        self.assertEqual(50, event['bytes_per_sec'])
+        self.assertEqual(6, event['eta'])
+        self.assertEqual(2, event['elapsed'])
+
+        monotonic_mock.return_value = 13
+        tracker.change(Delete(self.record))
+        event = events[-1]
+        self.assertEqual('Delete', event['change'])
+        self.assertEqual(2, event['done'])
+        self.assertEqual(100, event['bytes_sent'])
+
+        # the window only has the last 3 samples so the slow start drops out
+        monotonic_mock.return_value = 14
+        tracker.batch(1, 50)
+        event = events[-1]
+        self.assertEqual('batch', event['event'])
+        self.assertEqual(1, event['count'])
+        self.assertEqual(3, event['done'])
+        self.assertEqual(1.0, event['ops_per_sec'])
+        self.assertEqual(25, event['bytes_per_sec'])
+        self.assertEqual(1, event['eta'])
+
+        # a stall, no progress over the window
+        tracker._samples.extend([(15, 3, 150)] * 3)
+        tracker.finish()
+        event = events[-1]
+        self.assertEqual('zone-done', event['event'])
+        self.assertEqual(0.0, event['ops_per_sec'])
+        self.assertIsNone(event['eta'])
+
+        # all done
+        tracker.batch(1)
+        self.assertEqual(0.0, events[-1]['eta'])
+
+    def test_fail_and_close(self):
+        events = []
+        sink = MagicMock()
+        tracker = ProgressTracker('unit.tests.', 2, [events.append, sink])
+        tracker.start()
+        tracker.fail(Exception('boom'))
+        self.assertEqual('zone-failed', events[-1]['event'])
+        self.assertEqual('boom', events[-1]['error'])
+        self.assertEqual(0, events[-1]['done'])
+
+        # sinks with a close are closed, plain callables are left alone
+        tracker.close()
+        sink.close.assert_called_once_with()
+
+    def test_no_sinks(self):
+        tracker = ProgressTracker('unit.tests.', 1, [])
+        tracker.start()
+        tracker.change(Create(self.record))
+        tracker.finish()
+        self.assertEqual(1, tracker.done)
+
+
+class TestProgressSinks(TestCase):
+    event = {
+        'event': 'change',
+        'zone': 'unit.tests.',
+        'done': 2,
+        'total': 4,
+        'ops_per_sec': 0.5,
+        'bytes_sent': 100,
+        'bytes_per_sec': 50,
+        'eta': 4,
+    }
+
+    @patch('octodns_edgedns.progress.monotonic')
+    def test_log(self, monotonic_mock):
+        log = getLogger('test-progress')
+        sink = LogProgressSink(log, interval=10)
+
+        monotonic_mock.return_value = 100
+        with self.assertLogs(log, 'INFO') as logs:
+            sink(self.event)
+            # within the interval changes are skipped
+            monotonic_mock.return_value = 105
+            sink(self.event)
+            # others aren't
+            sink(dict(self.event, event='zone-done', eta=None))
+            monotonic_mock.return_value = 110
+            sink(self.event)
+        self.assertEqual(
+            [
+                'INFO:test-progress:progress: change zone=unit.tests., 2/4, '
+                '0.5 ops/s, 100 bytes sent, 50 bytes/s, eta=4s',
+                'INFO:test-progress:progress: zone-done zone=unit.tests., '
+                '2/4, 0.5 ops/s, 100 bytes sent, 50 bytes/s, eta=unknown',
+                'INFO:test-progress:progress: change zone=unit.tests., 2/4, '
+                '0.5 ops/s, 100 bytes sent, 50 bytes/s, eta=4s',
+            ],
+            logs.output,
+        )
+
+    def test_json_lines(self):
+        with TemporaryDirectory() as td:
+            filename = join(td, 'progress.jsonl')
+            sink = JsonLinesProgressSink(filename)
+            done = dict(self.event, event='zone-done', done=4)
+            with patch('builtins.open', wraps=open) as open_mock:
+                sink(self.event)
+                # lines are written as they happen
+                with open(filename) as fh:
+                    self.assertEqual([self.event], [loads(line) for line in fh])
+                sink(dict(self.event, done=3))
+                sink(done)
+                # opened once for the zone, the other open is our read above,
+                # and closed when it's done
+                self.assertEqual(2, open_mock.call_count)
+                self.assertIsNone(sink._fh)
+
+                # the next zone opens it again, close closes it early and
+                # is safe to call again
+                sink(self.event)
+                self.assertEqual(3, open_mock.call_count)
+                sink.close()
+                self.assertIsNone(sink._fh)
+                sink.close()
+
+                # a failure ends the zone too
+                sink(self.event)
+                sink(dict(self.event, event='zone-failed', error='boom'))
+                self.assertIsNone(sink._fh)
+
+            with open(filename) as fh:
+                events = [loads(line) for line in fh]
+        self.assertEqual(
+            [self.event, dict(self.event, done=3), done, self.event], events[:4]
+        )
+        self.assertEqual(
+            ['change', 'zone-failed'], [e['event'] for e in events[4:]]
+        )
@@ -0,0 +1,256 @@
+#
+#
+#
+
+from unittest import TestCase
+
+from octodns_edgedns.zonefile import (
+    ZoneFileParseError,
+    parse_zone_file,
+    render_zone_file,
+    zone_file_recordsets,
+)
+
+
+class TestZoneFile(TestCase):
+    def parse(self, text, origin='unit.tests.'):
+        return list(parse_zone_file(text.split('\n'), origin))
+
+    def test_fixture(self):
+        with open('tests/fixtures/edgedns-records.zone') as fh:
+            recordsets = zone_file_recordsets(fh, 'unit.tests')
+        self.assertEqual(24, len(recordsets))
+        self.assertEqual(
+            {
+                'name': 'unit.tests',
+                'type': 'SOA',
+                'ttl': 3600,
+                'rdata': [
+                    'ns1.akam.net. hostmaster.akamai.com. 1489074932 86400 '
+                    '7200 604800 300'
+                ],
+            },
+            recordsets[0],
+        )
+        self.assertEqual(
+            {
+                'name': 'txt.unit.tests',
+                'type': 'TXT',
+                'ttl': 600,
+                'rdata': [
+                    '"Bah bah black sheep"',
+                    '"have you any wool."',
+                    '"v=DKIM1;k=rsa;s=email;h=sha256;p=A/kinda+of/long/'
+                    'string+with+numb3rs"',
+                ],
+            },
+            recordsets[-3],
+        )
+
+    def test_render(self):
+        recordsets = [
+            {'name': 'unit.tests', 'type': 'A', 'ttl': 300, 'rdata': []},
+            {
+                'name': 'txt.unit.tests',
+                'type': 'TXT',
+                'ttl': 600,
+                'rdata': ['"semi; colon"', '"two"'],
+            },
+        ]
+        lines = list(render_zone_file(recordsets))
+        self.assertEqual(
+            [
+                'txt.unit.tests. 600 IN TXT "semi; colon"\n',
+                'txt.unit.tests. 600 IN TXT "two"\n',
+            ],
+            lines,
+        )
+
+        # names in rdata the API returns without a trailing dot are fully
+        # qualified, not relative, and get one
+        recordsets = [
+            {
+                'name': 'unit.tests',
+                'type': 'SOA',
+                'ttl': 300,
+                'rdata': ['ns1.akam.net hostmaster.akamai.com 1 2 3 4 5'],
+            },
+            {
+                'name': 'cname.unit.tests',
+                'type': 'CNAME',
+                'ttl': 300,
+                'rdata': ['unit.tests'],
+            },
+            {
+                'name': 'mx.unit.tests',
+                'type': 'MX',
+                'ttl': 300,
+                'rdata': ['10 smtp.unit.tests', '20 other.tests.'],
+            },
+            {
+                'name': '_srv._tcp.unit.tests',
+                'type': 'SRV',
+                'ttl': 300,
+                'rdata': ['10 20 30 foo.unit.tests', '0 0 0 .'],
+            },
+            {
+                'name': 'naptr.unit.tests',
+                'type': 'NAPTR',
+                'ttl': 300,
+                'rdata': ['10 100 "S" "SIP+D2U" "!^.* $!x!" sip.unit.tests'],
+            },
+            {
+                'name': 'svcb.unit.tests',
+                'type': 'SVCB',
+                'ttl': 300,
+                'rdata': ['1 svc.unit.tests alpn=h2'],
+            },
+            {
+                'name': 'short.unit.tests',
+                'type': 'MX',
+                'ttl': 300,
+                'rdata': ['10'],
+            },
+        ]
+        self.assertEqual(
+            [
+                'unit.tests. 300 IN SOA ns1.akam.net. hostmaster.akamai.com. '
+                '1 2 3 4 5\n',
+                'cname.unit.tests. 300 IN CNAME unit.tests.\n',
+                'mx.unit.tests. 300 IN MX 10 smtp.unit.tests.\n',
+                'mx.unit.tests. 300 IN MX 20 other.tests.\n',
+                '_srv._tcp.unit.tests. 300 IN SRV 10 20 30 foo.unit.tests.\n',
+                '_srv._tcp.unit.tests. 300 IN SRV 0 0 0 .\n',
+                'naptr.unit.tests. 300 IN NAPTR 10 100 "S" "SIP+D2U" '
+                '"!^.* $!x!" sip.unit.tests.\n',
+                'svcb.unit.tests. 300 IN SVCB 1 svc.unit.tests. alpn=h2\n',
+                'short.unit.tests. 300 IN MX 10\n',
+            ],
+            list(render_zone_file(recordsets)),
+        )
+
+        # round-trips through the parser
+        with open('tests/fixtures/edgedns-records.zone') as fh:
+            recordsets = zone_file_recordsets(fh, 'unit.tests')
+        lines = render_zone_file(recordsets)
+        self.assertEqual(recordsets, zone_file_recordsets(lines, 'other.tests'))
+
+    def test_names(self):
+        self.assertEqual(
+            [
+                ('unit.tests', 'A', 60, '1.2.3.4'),
+                ('www.unit.tests', 'CNAME', 60, 'unit.tests.'),
+                ('abs.unit.tests', 'CNAME', 60, 'other.tests.'),
+                ('abs.unit.tests', 'MX', 60, '10 mx.unit.tests.'),
+                ('srv.unit.tests', 'SRV', 60, '0 0 0 .'),
+                ('www.sub.unit.tests', 'A', 60, '1.2.3.4'),
+                ('sub.unit.tests', 'PTR', 60, 'ptr.sub.unit.tests.'),
+                (
+                    'sub.unit.tests',
+                    'SOA',
+                    60,
+                    'ns1.sub.unit.tests. hostmaster.example.com. 1 2 3 4 5',
+                ),
+                ('short.sub.unit.tests', 'MX', 60, '10'),
+            ],
+            self.parse(
+                '''@ 60 A 1.2.3.4
+www 60 CNAME @
+abs.unit.tests. 60 CNAME other.tests.
+  60 MX 10 mx
+srv 60 SRV 0 0 0 .
+$ORIGIN sub
+www 60 A 1.2.3.4
+@ 60 PTR ptr
+@ 60 SOA ns1 hostmaster.example.com. 1 2 3 4 5
+short 60 MX 10
+''',
+                # origin without the trailing dot
+                'unit.tests',
+            ),
+        )
+
+    def test_ttls(self):
+        self.assertEqual(
+            [
+                ('a.unit.tests', 'A', 42, '1.2.3.4'),
+                ('b.unit.tests', 'A', 42, '1.2.3.4'),
+                ('c.unit.tests', 'A', 5400, '1.2.3.4'),
+                ('d.unit.tests', 'A', 5400, '1.2.3.4'),
+                ('e.unit.tests', 'A', 86400, '1.2.3.4'),
+                ('f.unit.tests', 'A', 300, '1.2.3.4'),
+                ('g.unit.tests', 'A', 300, '1.2.3.4'),
+                ('h.unit.tests', 'A', 1209600, '1.2.3.4'),
+            ],
+            self.parse('''a 42 IN A 1.2.3.4
+; no ttl or $TTL, last one is used
+b IN A 1.2.3.4
+c 1h30M IN A 1.2.3.4
+d A 1.2.3.4
+e IN 1d A 1.2.3.4
+$ttl 5m
+f A 1.2.3.4
+g CH A 1.2.3.4
+h 2w A 1.2.3.4
+'''),
+        )
+
+    def test_quoting(self):
+        self.assertEqual(
+            [
+                ('txt.unit.tests', 'TXT', 60, '"semi; colon" "paren ( )"'),
+                ('txt.unit.tests', 'TXT', 60, '"esc\\"aped" unquoted\\;semi'),
+                ('txt.unit.tests', 'TXT', 60, '"multi" "line"'),
+            ],
+            self.parse('''txt 60 TXT "semi; colon"   "paren ( )" ; comment
+    60 TXT "esc\\"aped" unquoted\\;semi
+    60 TXT ( "multi"
+        "line" ) ; done
+'''),
+        )
+
+    def test_errors(self):
+        with self.assertRaises(ZoneFileParseError) as ctx:
+            self.parse('a 60 A 1.2.3.4 )')
+        self.assertEqual('Unbalanced parentheses, line 1', str(ctx.exception))
+        self.assertEqual(1, ctx.exception.lineno)
+
+        with self.assertRaises(ZoneFileParseError) as ctx:
+            self.parse('\na 60 TXT ( "open"\n\n')
+        self.assertEqual('Unbalanced parentheses, line 2', str(ctx.exception))
+
+        with self.assertRaises(ZoneFileParseError) as ctx:
+            self.parse('$TTL 1x')
+        self.assertEqual('Invalid $TTL "1x", line 1', str(ctx.exception))
+
+        with self.assertRaises(ZoneFileParseError) as ctx:
+            self.parse('$TTL 10h5')
+        self.assertEqual('Invalid $TTL "10h5", line 1', str(ctx.exception))
+
+        with self.assertRaises(ZoneFileParseError) as ctx:
+            self.parse('$INCLUDE other.zone')
+        self.assertEqual(
+            'Unsupported directive "$INCLUDE", line 1', str(ctx.exception)
+        )
+
+        with self.assertRaises(ZoneFileParseError) as ctx:
+            self.parse('$ORIGIN')
+        self.assertEqual(
+            'Unsupported directive "$ORIGIN", line 1', str(ctx.exception)
+        )
+
+        with self.assertRaises(ZoneFileParseError) as ctx:
+            self.parse('  60 A 1.2.3.4')
+        self.assertEqual('Record without an owner, line 1', str(ctx.exception))
+
+        with self.assertRaises(ZoneFileParseError) as ctx:
+            self.parse('a 60 IN')
+        self.assertEqual('Record without a type, line 1', str(ctx.exception))
+
+        with self.assertRaises(ZoneFileParseError) as ctx:
+            self.parse('a')
+        self.assertEqual('Record without a type, line 1', str(ctx.exception))
+
+        with self.assertRaises(ZoneFileParseError) as ctx:
+            self.parse('a A 1.2.3.4')
+        self.assertEqual('Record without a TTL, line 1', str(ctx.exception))
@@ -2,19 +2,31 @@
 #
 #
 
+import tracemalloc
+from json import loads
 from os.path import dirname, join
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
 from unittest import TestCase
 from unittest.mock import patch
 
-from requests import HTTPError
+from requests import ConnectionError, HTTPError
 from requests_mock import ANY
 from requests_mock import mock as requests_mock
 
+from octodns.provider import ProviderException
 from octodns.provider.yaml import YamlProvider
-from octodns.record import Record
+from octodns.record import Delete, Record, ValidationError
 from octodns.zone import Zone
 
-from octodns_edgedns import AkamaiProvider
+from octodns_edgedns import (
+    AdaptiveLimiter,
+    AkamaiClient,
+    AkamaiProvider,
+    PopulateProfile,
+    RdataCache,
+)
+from octodns_edgedns.zonefile import zone_file_recordsets
 
 
 class TestEdgeDnsProvider(TestCase):
@@ -75,6 +87,15 @@ class TestEdgeDnsProvider(TestCase):
             provider.populate(zone)
             self.assertEqual(set(), zone.records)
 
+        # for a while we remember that it's missing
+        with requests_mock() as mock:
+            zone = Zone('unit.tests.', [])
+            self.assertFalse(provider.populate(zone))
+            self.assertEqual(0, mock.call_count)
+
+        # once that expires we look again
+        provider._zone_missing[zone.name] = 0
+
         # No diffs == no changes
         with requests_mock() as mock:
             with open('tests/fixtures/edgedns-records.json') as fh:
@@ -92,7 +113,395 @@ class TestEdgeDnsProvider(TestCase):
         self.assertEqual(23, len(again.records))
 
         # bust the cache
-        del provider._zone_records[zone.name]
+        provider._forget_zone(zone.name)
+        self.assertNotIn(zone.name, provider._zone_records)
+
+    def test_zone_records_single_flight(self):
+        provider = AkamaiProvider("test", "secret", "akam.com", "atok", "ctok")
+        zone = Zone('unit.tests.', [])
+
+        release = Event()
+        calls = []
+        recordsets = [{'name': 'unit.tests', 'type': 'A'}]
+
+        def fetch(zone):
+            calls.append(zone.name)
+            release.wait(1)
+            if isinstance(recordsets, Exception):
+                raise recordsets
+            return recordsets
+
+        def run(results):
+            try:
+                results.append(provider.zone_records(zone))
+            except Exception as e:
+                results.append(e)
+
+        with patch.object(provider, '_fetch_zone_records', side_effect=fetch):
+            # two callers, one fetch
+            first = []
+            second = []
+            one = Thread(target=run, args=(first,))
+            one.start()
+            while zone.name not in provider._zone_fetches:
+                one.join(0.01)
+            two = Thread(target=run, args=(second,))
+            two.start()
+            two.join(0.1)
+            release.set()
+            one.join(1)
+            two.join(1)
+            self.assertEqual(['unit.tests.'], calls)
+            self.assertIs(recordsets, first[0])
+            self.assertIs(recordsets, second[0])
+            self.assertEqual({}, provider._zone_fetches)
+
+            # failures are shared with those waiting, but not cached
+            provider._forget_zone(zone.name)
+            calls.clear()
+            release.clear()
+            recordsets = HTTPError('Things caught fire')
+            first = []
+            second = []
+            one = Thread(target=run, args=(first,))
+            one.start()
+            while zone.name not in provider._zone_fetches:
+                one.join(0.01)
+            two = Thread(target=run, args=(second,))
+            two.start()
+            two.join(0.1)
+            release.set()
+            one.join(1)
+            two.join(1)
+            self.assertEqual(['unit.tests.'], calls)
+            self.assertIs(recordsets, first[0])
+            self.assertIs(recordsets, second[0])
+            self.assertEqual({}, provider._zone_fetches)
+            self.assertNotIn(zone.name, provider._zone_records)
+            self.assertNotIn(zone.name, provider._zone_missing)
+
+    def test_populate_zone_file(self):
+        provider = AkamaiProvider(
+            "test", "secret", "akam.com", "atok", "ctok", zone_file=True
+        )
+
+        # Non-existant zone doesn't populate anything
+        with requests_mock() as mock:
+            mock.get(ANY, status_code=404)
+
+            zone = Zone('unit.tests.', [])
+            self.assertFalse(provider.populate(zone))
+            self.assertEqual(set(), zone.records)
+
+        provider._forget_zone(zone.name)
+        with requests_mock() as mock:
+            with open('tests/fixtures/edgedns-records.zone') as fh:
+                mock.get(
+                    'https://akam.com/config-dns/v2/zones/unit.tests/zone-file',
+                    text=fh.read(),
+                )
+
+            zone = Zone('unit.tests.', [])
+            self.assertTrue(provider.populate(zone))
+            self.assertEqual('text/dns', mock.last_request.headers['Accept'])
+            # same records as the recordsets API
+            self.assertEqual(23, len(zone.records))
+            changes = self.expected.changes(zone, provider)
+            self.assertEqual(0, len(changes))
+
+    def test_populate_trusted_source(self):
+        provider = AkamaiProvider(
+            "test",
+            "secret",
+            "akam.com",
+            "atok",
+            "ctok",
+            trusted_source=True,
+            strict_supports=False,
+        )
+
+        with requests_mock() as mock:
+            with open('tests/fixtures/edgedns-records.json') as fh:
+                mock.get(ANY, text=fh.read())
+
+            zone = Zone('unit.tests.', [])
+            with patch('octodns_edgedns.Record.new') as new_mock:
+                provider.populate(zone, target=True)
+                new_mock.assert_not_called()
+            # same records as a validated populate
+            self.assertEqual(23, len(zone.records))
+            changes = self.expected.changes(zone, provider)
+            self.assertEqual(0, len(changes))
+
+            # populating as a source still validates everything
+            with patch('octodns_edgedns.Record.new', wraps=Record.new) as new:
+                provider.populate(Zone('unit.tests.', []))
+                self.assertEqual(23, new.call_count)
+
+        # invalid data isn't caught when populating
+        cname = {
+            'recordsets': [
+                {
+                    'name': 'unit.tests',
+                    'type': 'CNAME',
+                    'ttl': 300,
+                    'rdata': ['other.tests.'],
+                }
+            ]
+        }
+        provider._forget_zone('unit.tests.')
+        with requests_mock() as mock:
+            mock.get(ANY, json=cname)
+
+            zone = Zone('unit.tests.', [])
+            provider.populate(zone, target=True)
+            self.assertEqual(1, len(zone.records))
+
+            # where it would be as a source or without trusted_source
+            with self.assertRaises(ValidationError):
+                provider.populate(Zone('unit.tests.', []))
+            provider._trusted_source = False
+            with self.assertRaises(ValidationError):
+                provider.populate(Zone('unit.tests.', []), target=True)
+
+        # it's validated once it's part of a change, plan populates targets
+        # leniently so that's a warning
+        provider._trusted_source = True
+        with self.assertLogs('Record', 'WARNING') as logs:
+            plan = provider.plan(Zone('unit.tests.', []))
+        self.assertEqual(1, len(plan.changes))
+        self.assertIn('root CNAME not allowed', logs.output[0])
+
+        # strict populates are validated strictly
+        zone = Zone('unit.tests.', [])
+        provider.populate(zone, target=True, lenient=False)
+        change = Delete(next(iter(zone.records)))
+        with self.assertRaises(ValidationError) as ctx:
+            provider._include_change(change)
+        self.assertIn('root CNAME not allowed', str(ctx.exception))
+
+    def test_rdata_cache(self):
+        cache = AkamaiProvider.rdata_cache
+        cache.clear()
+
+        with open('tests/fixtures/edgedns-records.json') as fh:
+            recordsets = fh.read()
+
+        one = AkamaiProvider(
+            "one", "secret", "akam.com", "atok", "ctok", rdata_cache=True
+        )
+        two = AkamaiProvider(
+            "two", "secret", "akam.com", "atok", "ctok", rdata_cache=True
+        )
+        with requests_mock() as mock:
+            mock.get(ANY, text=recordsets)
+
+            zone = Zone('unit.tests.', [])
+            one.populate(zone)
+            self.assertEqual(0, len(self.expected.changes(zone, one)))
+            # 13 recordsets of cached types, two of which have identical rdata
+            stats = cache.stats()
+            self.assertEqual(1, stats['hits'])
+            self.assertEqual(12, stats['misses'])
+            self.assertEqual(12, stats['size'])
+
+            # a 2nd provider is all hits and gets the same records
+            zone = Zone('unit.tests.', [])
+            two.populate(zone)
+            self.assertEqual(0, len(self.expected.changes(zone, two)))
+            self.assertEqual(
+                {
+                    'hits': 14,
+                    'misses': 12,
+                    'hit_rate': 14 / 26,
+                    'size': 12,
+                    'maxsize': 65536,
+                },
+                cache.stats(),
+            )
+
+        # the cache only holds frozen values
+        for values in cache._values.values():
+            self.assertIsInstance(values, tuple)
+        frozen = cache.get(('SVCB', ('1 . alpn=h2,h3',)))[0]
+        with self.assertRaises(TypeError):
+            frozen['svcparams']['alpn'] = ['h1']
+        self.assertEqual(('h2', 'h3'), frozen['svcparams']['alpn'])
+
+        # records don't share mutable state with the cache or each other
+        svcb = next(r for r in zone.records if r._type == 'SVCB')
+        svcb.values[0].svcparams['alpn'].append('h1')
+        data = two._data_for('SVCB', {'ttl': 3600, 'rdata': ['1 . alpn=h2,h3']})
+        self.assertEqual(['h2', 'h3'], data['values'][0]['svcparams']['alpn'])
+        data['values'].append('junk')
+        mx = {'ttl': 300, 'rdata': ['10 smtp-4.unit.tests.']}
+        first = two._data_for('MX', mx)
+        first['values'].append('junk')
+        self.assertEqual(1, len(two._data_for('MX', mx)['values']))
+
+        first['values'][0]['preference'] = '99'
+        self.assertEqual(
+            [{'preference': '10', 'exchange': 'smtp-4.unit.tests.'}],
+            two._data_for('MX', mx)['values'],
+        )
+
+        # types that aren't worth it and providers that don't opt in skip it
+        cache.clear()
+        two._data_for('A', {'ttl': 300, 'rdata': ['1.2.3.4']})
+        off = AkamaiProvider("off", "secret", "akam.com", "atok", "ctok")
+        data = off._data_for('MX', mx)
+        self.assertEqual(
+            [{'preference': '10', 'exchange': 'smtp-4.unit.tests.'}],
+            data['values'],
+        )
+        self.assertEqual(0, cache.stats()['misses'])
+        with requests_mock() as mock:
+            mock.get(ANY, text=recordsets)
+            zone = Zone('unit.tests.', [])
+            off.populate(zone)
+            self.assertEqual(0, len(self.expected.changes(zone, off)))
+        self.assertEqual(0, cache.stats()['size'])
+
+    def test_rdata_cache_lru(self):
+        cache = RdataCache(maxsize=2)
+        self.assertEqual(0.0, cache.stats()['hit_rate'])
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', (1,))
+        cache.set('b', (2,))
+        # a is now the most recently used
+        self.assertEqual((1,), cache.get('a'))
+        cache.set('c', (3,))
+        # so b was evicted
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((1,), cache.get('a'))
+        self.assertEqual((3,), cache.get('c'))
+        self.assertEqual(
+            {'hits': 3, 'misses': 2, 'hit_rate': 0.6, 'size': 2, 'maxsize': 2},
+            cache.stats(),
+        )
+
+    def test_populate_profile(self):
+        with TemporaryDirectory() as td:
+            filename = join(td, 'profile.json')
+            provider = AkamaiProvider(
+                "test",
+                "secret",
+                "akam.com",
+                "atok",
+                "ctok",
+                profile_populate=filename,
+                profile_populate_memory=True,
+            )
+
+            with requests_mock() as mock:
+                with open('tests/fixtures/edgedns-records.json') as fh:
+                    mock.get(ANY, text=fh.read())
+
+                zone = Zone('unit.tests.', [])
+                with self.assertLogs(provider.log, 'INFO') as logs:
+                    provider.populate(zone)
+                self.assertEqual(23, len(zone.records))
+                # profiling doesn't change what's found
+                changes = self.expected.changes(zone, provider)
+                self.assertEqual(0, len(changes))
+
+            # tracing was stopped since we started it
+            self.assertFalse(tracemalloc.is_tracing())
+            self.assertFalse(PopulateProfile._tracing)
+
+            output = '\n'.join(logs.output)
+            self.assertIn('profile download: 24 recordsets', output)
+            self.assertIn('profile SRV: 3 records', output)
+            self.assertRegex(output, r'Record.new \(-?\d+ bytes retained\)')
+
+            # 2nd populate from cache appends a 2nd breakdown
+            provider.populate(Zone('unit.tests.', []))
+
+            with open(filename) as fh:
+                breakdowns = [loads(line) for line in fh]
+            self.assertEqual(2, len(breakdowns))
+            breakdown = breakdowns[0]
+            self.assertEqual('unit.tests.', breakdown['zone'])
+            phases = breakdown['phases']
+            self.assertEqual(24, phases['download']['count'])
+            self.assertEqual(23, phases['parse']['count'])
+            self.assertEqual(23, phases['record']['count'])
+            types = breakdown['types']
+            self.assertEqual(3, types['SRV']['parse']['count'])
+            self.assertEqual(3, types['SRV']['record']['count'])
+            self.assertEqual(0, types['SRV']['download']['count'])
+            self.assertGreater(types['SRV']['record']['seconds'], 0)
+            self.assertEqual(
+                {'count', 'seconds', 'retained'},
+                set(types['A']['record'].keys()),
+            )
+            self.assertIsInstance(types['A']['record']['retained'], int)
+
+        # log only, tracing someone else started is left running and
+        # failures still release it
+        provider = AkamaiProvider(
+            "test",
+            "secret",
+            "akam.com",
+            "atok",
+            "ctok",
+            profile_populate=True,
+            profile_populate_memory=True,
+        )
+        tracemalloc.start()
+        try:
+            with requests_mock() as mock:
+                mock.get(ANY, status_code=502, text='Things caught fire')
+                with self.assertRaises(HTTPError):
+                    provider.populate(Zone('unit.tests.', []))
+            self.assertTrue(tracemalloc.is_tracing())
+            self.assertFalse(PopulateProfile._tracing)
+        finally:
+            tracemalloc.stop()
+
+        with requests_mock() as mock:
+            with open('tests/fixtures/edgedns-records.json') as fh:
+                mock.get(ANY, text=fh.read())
+            with self.assertLogs(provider.log, 'INFO') as logs:
+                provider.populate(Zone('unit.tests.', []))
+            self.assertIn('profile SRV: 3 records', '\n'.join(logs.output))
+
+        # overlapping profiles share tracing, the last one out stops it
+        one = PopulateProfile('one.tests.', memory=True)
+        two = PopulateProfile('two.tests.', memory=True)
+        one.start()
+        two.start()
+        one.stop()
+        self.assertTrue(tracemalloc.is_tracing())
+        two.stop()
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_populate_profile_timing_only(self):
+        provider = AkamaiProvider(
+            "test", "secret", "akam.com", "atok", "ctok", profile_populate=True
+        )
+        with requests_mock() as mock:
+            with open('tests/fixtures/edgedns-records.json') as fh:
+                mock.get(ANY, text=fh.read())
+            with patch('octodns_edgedns.tracemalloc') as tracemalloc_mock:
+                with self.assertLogs(provider.log, 'INFO') as logs:
+                    provider.populate(Zone('unit.tests.', []))
+        # timings aren't skewed by tracing allocations
+        tracemalloc_mock.start.assert_not_called()
+        tracemalloc_mock.get_traced_memory.assert_not_called()
+
+        output = '\n'.join(logs.output)
+        self.assertIn('profile download: 24 recordsets, ', output)
+        self.assertNotIn('bytes', output)
+        self.assertRegex(
+            output, r'profile SRV: 3 records, [\d.]+s parse, [\d.]+s Record.new'
+        )
+
+        profile = PopulateProfile('unit.tests.')
+        profile.add('parse', profile.mark(), 'A')
+        parse = profile.breakdown()['types']['A']['parse']
+        self.assertEqual(1, parse['count'])
+        self.assertIsNone(parse['retained'])
 
     def test_apply(self):
         provider = AkamaiProvider(
@@ -172,6 +581,484 @@ class TestEdgeDnsProvider(TestCase):
                 expected = "contractId not specified to create zone"
                 self.assertEqual(str(e), expected)
 
+    def test_apply_zone_file(self):
+        provider = AkamaiProvider(
+            "test",
+            "s",
+            "akam.com",
+            "atok",
+            "ctok",
+            "cid",
+            "gid",
+            zone_file_threshold=0.5,
+            strict_supports=False,
+        )
+
+        with open('tests/fixtures/edgedns-records-prev.json') as fh:
+            prev = fh.read()
+
+        # most of the zone changes, so it's uploaded in one go
+        with requests_mock() as mock:
+            mock.get(ANY, text=prev)
+            plan = provider.plan(self.expected)
+            post = mock.post(
+                'https://akam.com/config-dns/v2/zones/unit.tests/zone-file',
+                status_code=204,
+            )
+
+            with self.assertLogs(provider.log, 'INFO') as logs:
+                changes = provider.apply(plan)
+            self.assertEqual(35, changes)
+            self.assertIn('uploading zone file', '\n'.join(logs.output))
+
+            self.assertEqual(1, post.call_count)
+            # everything else was GETs
+            self.assertEqual(
+                {'GET', 'POST'}, set(r.method for r in mock.request_history)
+            )
+            request = post.last_request
+            self.assertEqual('text/dns', request.headers['Content-Type'])
+
+        body = request.body.decode('utf-8')
+        recordsets = {
+            (r['name'], r['type']): r
+            for r in zone_file_recordsets(body.split('\n'), 'unit.tests')
+        }
+        # unmanaged records from the existing zone are kept, with the names
+        # the API returns without a trailing dot qualified so they aren't
+        # taken as relative to the zone
+        self.assertIn(
+            'unit.tests. 3600 IN SOA ns1.akam.net. hostmaster.akamai.com. '
+            '1489074932 86400 7200 604800 300\n',
+            body,
+        )
+        self.assertEqual(
+            [
+                'ns1.akam.net. hostmaster.akamai.com. 1489074932 86400 7200 '
+                '604800 300'
+            ],
+            recordsets[('unit.tests', 'SOA')]['rdata'],
+        )
+        # deletes are gone
+        self.assertNotIn(('old.unit.tests', 'A'), recordsets)
+        # creates and updates are rendered with _params_for_*
+        self.assertEqual(
+            {
+                'name': 'txt.unit.tests',
+                'type': 'TXT',
+                'ttl': 600,
+                'rdata': [
+                    '"Bah bah black sheep"',
+                    '"have you any wool."',
+                    '"v=DKIM1;k=rsa;s=email;h=sha256;p=A/kinda+of/long/'
+                    'string+with+numb3rs"',
+                ],
+            },
+            recordsets[('txt.unit.tests', 'TXT')],
+        )
+        self.assertEqual(
+            [
+                '10 smtp-4.unit.tests.',
+                '20 smtp-2.unit.tests.',
+                '30 smtp-3.unit.tests.',
+                '40 smtp-1.unit.tests.',
+            ],
+            recordsets[('mx.unit.tests', 'MX')]['rdata'],
+        )
+
+        self.assertEqual(
+            ['0 issue "ca.unit.tests"'],
+            recordsets[('unit.tests', 'CAA')]['rdata'],
+        )
+
+        # below the threshold changes are made one at a time
+        provider._zone_file_threshold = 0.99
+        with requests_mock() as mock:
+            mock.get(ANY, text=prev)
+            plan = provider.plan(self.expected)
+            mock.post(ANY, status_code=201)
+            mock.put(ANY, status_code=200)
+            mock.delete(ANY, status_code=204)
+
+            changes = provider.apply(plan)
+            self.assertEqual(35, changes)
+            self.assertTrue(
+                all('zone-file' not in r.url for r in mock.request_history)
+            )
+
+    def test_zones_list(self):
+        client = AkamaiClient("s", "list.com", "atok", "ctok")
+
+        with requests_mock() as mock:
+            mock.get(
+                'https://list.com/config-dns/v2/zones',
+                [
+                    {
+                        'json': {
+                            'metadata': {'totalElements': 3},
+                            'zones': [{'zone': 'a.tests'}, {'zone': 'b.tests'}],
+                        }
+                    },
+                    {
+                        'json': {
+                            'metadata': {'totalElements': 3},
+                            'zones': [{'zone': 'c.tests'}],
+                        }
+                    },
+                ],
+            )
+            zones = list(client.zones_list('cid', pageSize=2))
+            self.assertEqual(
+                ['a.tests', 'b.tests', 'c.tests'], [z['zone'] for z in zones]
+            )
+            self.assertEqual(2, mock.call_count)
+            self.assertEqual(
+                {
+                    'contractids': ['cid'],
+                    'page': ['2'],
+                    'pagesize': ['2'],
+                    'showall': ['false'],
+                    'sortby': ['zone'],
+                },
+                mock.last_request.qs,
+            )
+
+        # an empty page ends things even if the total says otherwise
+        with requests_mock() as mock:
+            mock.get(ANY, json={'metadata': {'totalElements': 10}, 'zones': []})
+            self.assertEqual([], list(client.zones_list()))
+            self.assertEqual(1, mock.call_count)
+            self.assertNotIn('contractids', mock.last_request.qs)
+
+    def test_list_zones(self):
+        provider = AkamaiProvider(
+            "test",
+            "s",
+            "akam.com",
+            "atok",
+            "ctok",
+            "cid",
+            "gid",
+            list_zones=True,
+            strict_supports=False,
+        )
+
+        listing = {
+            'metadata': {'totalElements': 2},
+            'zones': [
+                {'zone': 'unit.tests', 'type': 'PRIMARY'},
+                {'zone': 'other.tests', 'type': 'PRIMARY'},
+            ],
+        }
+
+        with requests_mock() as mock:
+            mock.get('https://akam.com/config-dns/v2/zones', json=listing)
+            self.assertEqual(
+                ['other.tests.', 'unit.tests.'], provider.list_zones()
+            )
+            self.assertEqual(
+                {'zone': 'unit.tests', 'type': 'PRIMARY'},
+                provider.zone_index['unit.tests.'],
+            )
+            # listed once
+            provider.list_zones()
+            self.assertEqual(1, mock.call_count)
+
+            # zones that aren't listed aren't probed
+            zone = Zone('missing.tests.', [])
+            self.assertFalse(provider.populate(zone))
+            self.assertEqual(1, mock.call_count)
+
+        # listed zones are fetched and don't need a zone_get before applying
+        with requests_mock() as mock:
+            with open('tests/fixtures/edgedns-records-prev.json') as fh:
+                mock.get(
+                    'https://akam.com/config-dns/v2/zones/unit.tests/recordsets',
+                    text=fh.read(),
+                )
+            plan = provider.plan(self.expected)
+            mock.post(ANY, status_code=201)
+            mock.put(ANY, status_code=200)
+            mock.delete(ANY, status_code=204)
+
+            self.assertEqual(35, provider.apply(plan))
+            self.assertEqual(
+                1, len([r for r in mock.request_history if r.method == 'GET'])
+            )
+
+        # missing zones are created and then indexed
+        del provider.zone_index['unit.tests.']
+        with requests_mock() as mock:
+            plan = provider.plan(self.expected)
+            self.assertEqual(0, mock.call_count)
+            mock.post(ANY, status_code=201)
+            mock.put(ANY, status_code=200)
+            mock.delete(ANY, status_code=204)
+
+            self.assertEqual(21, provider.apply(plan))
+            self.assertEqual(
+                {
+                    'zone': 'unit.tests',
+                    'type': 'primary',
+                    'comment': None,
+                    'masters': [],
+                },
+                provider.zone_index['unit.tests.'],
+            )
+            self.assertFalse(
+                [r for r in mock.request_history if r.method == 'GET']
+            )
+
+    def test_apply_progress(self):
+        with TemporaryDirectory() as td:
+            filename = join(td, 'progress.jsonl')
+            provider = AkamaiProvider(
+                "test",
+                "s",
+                "akam.com",
+                "atok",
+                "ctok",
+                "cid",
+                "gid",
+                progress_interval=60,
+                progress_file=filename,
+                strict_supports=False,
+            )
+            self.assertEqual(2, len(provider.progress_sinks))
+            events = []
+            provider.progress_sinks.append(events.append)
+
+            with open('tests/fixtures/edgedns-records-prev.json') as fh:
+                prev = fh.read()
+
+            with requests_mock() as mock:
+                mock.get(ANY, text=prev)
+                plan = provider.plan(self.expected)
+                mock.post(ANY, status_code=201)
+                mock.put(ANY, status_code=200)
+                mock.delete(ANY, status_code=204)
+
+                with self.assertLogs(provider.log, 'INFO') as logs:
+                    provider.apply(plan)
+
+            self.assertEqual(
+                ['zone-start'] + ['change'] * 35 + ['zone-done'],
+                [e['event'] for e in events],
+            )
+            self.assertEqual(
+                {'Create', 'Update', 'Delete'},
+                set(e['change'] for e in events[1:-1]),
+            )
+            done = events[-1]
+            self.assertEqual(35, done['done'])
+            self.assertEqual(35, done['total'])
+            self.assertEqual(0, done['eta'])
+            # creates and updates send their content, deletes don't
+            self.assertEqual(
+                sum(
+                    len(r.body)
+                    for r in mock.request_history
+                    if r.method in ('POST', 'PUT')
+                ),
+                done['bytes_sent'],
+            )
+
+            # start, the first change and done, the rest are inside the
+            # interval
+            progress = [o for o in logs.output if 'progress:' in o]
+            self.assertEqual(3, len(progress))
+            self.assertIn('zone-done zone=unit.tests., 35/35', progress[-1])
+
+            with open(filename) as fh:
+                self.assertEqual(events, [loads(line) for line in fh])
+
+            # zone file uploads are a single batch
+            events.clear()
+            provider._zone_file_threshold = 0.5
+            with requests_mock() as mock:
+                mock.get(ANY, text=prev)
+                plan = provider.plan(self.expected)
+                post = mock.post(ANY, status_code=204)
+                provider.apply(plan)
+
+            self.assertEqual(
+                ['zone-start', 'batch', 'zone-done'],
+                [e['event'] for e in events],
+            )
+            self.assertEqual(35, events[1]['count'])
+            self.assertEqual(
+                len(post.last_request.body), events[1]['bytes_sent']
+            )
+
+            # a failure part way through is reported and the file closed
+            events.clear()
+            provider._zone_file_threshold = None
+            with requests_mock() as mock:
+                mock.get(ANY, text=prev)
+                plan = provider.plan(self.expected)
+                mock.post(ANY, status_code=201)
+                mock.put(ANY, status_code=200)
+                mock.delete(ANY, status_code=400, text='nope')
+                with self.assertRaises(HTTPError):
+                    provider.apply(plan)
+
+            self.assertEqual('zone-failed', events[-1]['event'])
+            self.assertIn('400', events[-1]['error'])
+            self.assertLess(events[-1]['done'], 35)
+            self.assertIsNone(provider.progress_sinks[1]._fh)
+            with open(filename) as fh:
+                self.assertEqual(
+                    'zone-failed', loads(fh.readlines()[-1])['event']
+                )
+
+    def test_apply_zone_file_txt_and_soa(self):
+        provider = AkamaiProvider(
+            "test",
+            "s",
+            "akam.com",
+            "atok",
+            "ctok",
+            zone_file_threshold=0,
+            strict_supports=False,
+        )
+
+        dkim = 'v=DKIM1\\;k=rsa\\;p=' + 'A' * 400
+        desired = Zone('unit.tests.', [])
+        desired.add_record(
+            Record.new(
+                desired,
+                'dkim',
+                {'ttl': 300, 'type': 'TXT', 'values': [dkim, 'short']},
+            )
+        )
+        soa = {
+            'recordsets': [
+                {
+                    'name': 'unit.tests',
+                    'type': 'SOA',
+                    'ttl': 3600,
+                    'rdata': ['ns1.akam.net hostmaster.akamai.com 1 2 3 4 5'],
+                }
+            ]
+        }
+
+        with requests_mock() as mock:
+            mock.get(
+                'https://akam.com/config-dns/v2/zones/unit.tests/recordsets',
+                json=soa,
+            )
+            mock.get(
+                'https://akam.com/config-dns/v2/zones/unit.tests',
+                json={'zone': 'unit.tests'},
+            )
+            post = mock.post(ANY, status_code=204)
+
+            provider.apply(provider.plan(desired))
+            body = post.last_request.body.decode('utf-8')
+
+        # long values are split into character-strings of at most 255
+        lines = [line for line in body.split('\n') if ' TXT ' in line]
+        self.assertEqual(2, len(lines))
+        self.assertEqual('dkim.unit.tests. 300 IN TXT "short"', lines[0])
+        chunks = lines[1].split(' TXT ', 1)[1].split('" "')
+        self.assertEqual(2, len(chunks))
+        self.assertTrue(all(len(c.strip('"')) <= 255 for c in chunks))
+        self.assertEqual(
+            dkim.replace('\\;', ';'), ''.join(c.strip('"') for c in chunks)
+        )
+
+        # without an SOA to start from the zone isn't replaced
+        provider._forget_zone('unit.tests.')
+        with requests_mock() as mock:
+            mock.get(
+                'https://akam.com/config-dns/v2/zones/unit.tests/recordsets',
+                json={'recordsets': []},
+            )
+            mock.get(
+                'https://akam.com/config-dns/v2/zones/unit.tests',
+                json={'zone': 'unit.tests'},
+            )
+            mock.post(ANY, status_code=201)
+
+            with self.assertLogs(provider.log, 'WARNING') as logs:
+                self.assertEqual(1, provider.apply(provider.plan(desired)))
+            self.assertIn('no SOA', logs.output[0])
+            self.assertTrue(
+                all('zone-file' not in r.url for r in mock.request_history)
+            )
+
+    def test_zone_file_threshold_validation(self):
+        for threshold in (0, 0.5, 1):
+            provider = AkamaiProvider(
+                "test",
+                "s",
+                "akam.com",
+                "atok",
+                "ctok",
+                zone_file_threshold=threshold,
+            )
+            self.assertEqual(threshold, provider._zone_file_threshold)
+
+        for threshold in (-0.1, 1.5, '0.5', True):
+            with self.assertRaises(ProviderException) as ctx:
+                AkamaiProvider(
+                    "test",
+                    "s",
+                    "akam.com",
+                    "atok",
+                    "ctok",
+                    zone_file_threshold=threshold,
+                )
+            self.assertIn(
+                'zone_file_threshold must be a number between 0 and 1',
+                str(ctx.exception),
+            )
+
+    def test_apply_caa(self):
+        provider = AkamaiProvider(
+            "test", "s", "akam.com", "atok", "ctok", "cid", "gid"
+        )
+
+        existing = {
+            'recordsets': [
+                {
+                    'name': 'caa.unit.tests',
+                    'type': 'CAA',
+                    'ttl': 300,
+                    'rdata': ['0 issue "old.ca"'],
+                }
+            ]
+        }
+        desired = Zone('unit.tests.', [])
+        for name, value in (('caa', 'new.ca'), ('new', 'ca; policy=ev')):
+            desired.add_record(
+                Record.new(
+                    desired,
+                    name,
+                    {
+                        'ttl': 300,
+                        'type': 'CAA',
+                        'value': {'flags': 0, 'tag': 'issue', 'value': value},
+                    },
+                )
+            )
+
+        with requests_mock() as mock:
+            mock.get(ANY, json=existing)
+            create = mock.post(ANY, status_code=201)
+            replace = mock.put(ANY, status_code=200)
+
+            plan = provider.plan(desired)
+            self.assertEqual(2, provider.apply(plan))
+
+            # values are quoted, the same as the API returns them
+            self.assertEqual(
+                ['0 issue "ca; policy=ev"'], create.last_request.json()['rdata']
+            )
+            self.assertEqual(
+                ['0 issue "new.ca"'], replace.last_request.json()['rdata']
+            )
+
     def test_zone_changelist_submit_with_comment(self):
         comment = "Managed by OctoDNS."
         provider = AkamaiProvider(
@@ -187,15 +1074,286 @@ class TestEdgeDnsProvider(TestCase):
         )
 
         with patch.object(provider._dns_client, '_request') as mock_request:
-            provider._dns_client.zone_changelist_submit("foo.bar.test.com")
+            provider._dns_client.zone_changelist_submit(
+                "foo.bar.test.com", comment
+            )
 
             mock_request.assert_called_once_with(
                 'POST',
                 'changelists/foo.bar.test.com/submit',
                 data={},
                 params={"comment": comment},
+                endpoint='zone_changelist_submit',
             )
 
+        # a stand-alone client falls back to its own comment
+        client = AkamaiClient("s", "akam.com", "atok", "ctok", comment)
+        with patch.object(client, '_request') as mock_request:
+            client.zone_changelist_submit("foo.bar.test.com")
+
+            mock_request.assert_called_once_with(
+                'POST',
+                'changelists/foo.bar.test.com/submit',
+                data={},
+                params={"comment": comment},
+                endpoint='zone_changelist_submit',
+            )
+
+    def test_shared_client(self):
+        one = AkamaiProvider("one", "s", "akam.com", "atok", "ctok")
+        two = AkamaiProvider(
+            "two", "s", "akam.com", "atok", "ctok", comment="Two"
+        )
+        # same host and credentials share a client
+        self.assertIs(one._dns_client, two._dns_client)
+        self.assertIs(
+            one._dns_client,
+            AkamaiClient.shared("s", "akam.com", "atok", "ctok"),
+        )
+
+        # anything else gets its own
+        other_host = AkamaiProvider("three", "s", "other.com", "atok", "ctok")
+        self.assertIsNot(one._dns_client, other_host._dns_client)
+        other_creds = AkamaiProvider("four", "s2", "akam.com", "atok", "ctok")
+        self.assertIsNot(one._dns_client, other_creds._dns_client)
+
+        # comments stay with the provider rather than the shared client
+        self.assertIsNone(one._comment)
+        self.assertEqual("Two", two._comment)
+        self.assertIsNone(one._dns_client.comment)
+
+    def test_shared_client_max_concurrency(self):
+        one = AkamaiProvider(
+            "one", "s", "limit.com", "atok", "ctok", max_concurrency=8
+        )
+        client = one._dns_client
+
+        def pool_maxsize():
+            adapter = client._sess.get_adapter('https://limit.com/')
+            return adapter._pool_maxsize
+
+        self.assertEqual(8, client.limiter.max_limit)
+        # the connection pool is big enough for everything in flight
+        self.assertEqual(8, pool_maxsize())
+        # the most conservative limit wins
+        AkamaiProvider("two", "s", "limit.com", "atok", "ctok")
+        self.assertEqual(8, client.limiter.max_limit)
+        self.assertEqual(8, pool_maxsize())
+        AkamaiProvider(
+            "three", "s", "limit.com", "atok", "ctok", max_concurrency=4
+        )
+        self.assertEqual(4, client.limiter.max_limit)
+        self.assertEqual(4, pool_maxsize())
+
+        # the default is over requests' default pool size of 10
+        other = AkamaiClient("s", "other.com", "atok", "ctok")
+        adapter = other._sess.get_adapter('https://other.com/')
+        self.assertEqual(16, adapter._pool_maxsize)
+
+    def test_adaptive_limiter(self):
+        limiter = AdaptiveLimiter(min_limit=1, max_limit=4)
+        self.assertEqual(1, limiter.limit)
+        self.assertEqual({}, limiter.baselines)
+
+        with patch('octodns_edgedns.monotonic') as mono:
+            mono.return_value = 0
+
+            def burst():
+                # as many requests as the limit allows, all at once
+                tickets = [limiter.acquire() for _ in range(int(limiter.limit))]
+                mono.return_value += 1
+                for ticket in tickets:
+                    limiter.release(ticket)
+
+            # stable latency ramps up additively, 1 -> 2 -> 2.5 -> ...
+            ticket = limiter.acquire()
+            self.assertEqual(1, limiter.in_flight)
+            mono.return_value = 1
+            limiter.release(ticket)
+            self.assertEqual(0, limiter.in_flight)
+            self.assertEqual(2, limiter.limit)
+            self.assertEqual({None: 1}, limiter.baselines)
+
+            # but only while the concurrency is being used, serial requests
+            # stall once they're under half the limit
+            for _ in range(20):
+                ticket = limiter.acquire()
+                mono.return_value += 1
+                limiter.release(ticket)
+            self.assertEqual(2.5, limiter.limit)
+
+            for _ in range(20):
+                burst()
+            # capped at max
+            self.assertEqual(4, limiter.limit)
+            self.assertEqual({None: 1}, limiter.baselines)
+
+            # throttling backs off multiplicatively and doesn't move the
+            # baseline
+            ticket = limiter.acquire()
+            mono.return_value += 5
+            limiter.release(ticket, throttled=True)
+            self.assertEqual(2, limiter.limit)
+            self.assertEqual({None: 1}, limiter.baselines)
+
+            # requests that started before the decrease don't decrease again
+            limiter.release(ticket, throttled=True)
+            limiter.in_flight += 1
+            self.assertEqual(2, limiter.limit)
+
+            # a latency spike backs off, but does move the baseline
+            mono.return_value += 1
+            ticket = limiter.acquire()
+            mono.return_value += 3
+            limiter.release(ticket)
+            self.assertEqual(1, limiter.limit)
+            self.assertAlmostEqual(1.2, limiter.baselines[None])
+
+            # never drops below min
+            mono.return_value += 1
+            ticket = limiter.acquire()
+            limiter.release(ticket, throttled=True)
+            self.assertEqual(1, limiter.limit)
+
+    def test_adaptive_limiter_endpoints(self):
+        limiter = AdaptiveLimiter(min_limit=1, max_limit=8)
+
+        with patch('octodns_edgedns.monotonic') as mono:
+            mono.return_value = 0
+
+            def burst(endpoint, elapsed, latency=True):
+                tickets = [limiter.acquire() for _ in range(int(limiter.limit))]
+                mono.return_value += elapsed
+                for ticket in tickets:
+                    limiter.release(ticket, endpoint=endpoint, latency=latency)
+
+            # quick writes interleaved with slow reads, each stable for their
+            # own endpoint, ramp up without any decreases
+            limits = []
+            for _ in range(20):
+                burst('record_create', 0.1)
+                burst('zone_get', 5)
+                burst('record_replace', 0.1)
+                limits.append(limiter.limit)
+            self.assertEqual(sorted(limits), limits)
+            self.assertEqual(8, limiter.limit)
+            self.assertEqual(
+                {'record_create': 0.1, 'record_replace': 0.1, 'zone_get': 5},
+                {k: round(v, 6) for k, v in limiter.baselines.items()},
+            )
+
+            # zone sized transfers vary with the zone, a large one after
+            # small ones isn't a spike, and they don't get a baseline
+            burst('zone_recordset_get', 0.1, latency=False)
+            burst('zone_recordset_get', 60, latency=False)
+            self.assertEqual(8, limiter.limit)
+            self.assertNotIn('zone_recordset_get', limiter.baselines)
+
+            # a write that's slow relative to other writes is still a spike
+            ticket = limiter.acquire()
+            mono.return_value += 1
+            limiter.release(ticket, endpoint='record_create')
+            self.assertEqual(4, limiter.limit)
+
+    def test_adaptive_limiter_blocks(self):
+        limiter = AdaptiveLimiter(min_limit=1, max_limit=1)
+        started = limiter.acquire()
+
+        acquired = []
+
+        def waiter():
+            acquired.append(limiter.acquire())
+
+        thread = Thread(target=waiter)
+        thread.start()
+        thread.join(0.1)
+        # limit of 1 is in use so the waiter is blocked
+        self.assertTrue(thread.is_alive())
+        self.assertEqual([], acquired)
+
+        limiter.release(started)
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(1, len(acquired))
+        self.assertEqual(1, limiter.in_flight)
+
+    @patch('octodns_edgedns.sleep')
+    def test_request_throttled(self, sleep_mock):
+        client = AkamaiClient("s", "throttle.com", "atok", "ctok")
+
+        # throttled, then ok, honoring Retry-After
+        with requests_mock() as mock:
+            mock.get(
+                ANY,
+                [
+                    {'status_code': 429, 'headers': {'Retry-After': '3'}},
+                    {'status_code': 503},
+                    {'status_code': 200, 'json': {'zone': 'unit.tests'}},
+                ],
+            )
+            resp = client.zone_get('unit.tests')
+            self.assertEqual({'zone': 'unit.tests'}, resp.json())
+            self.assertEqual(3, mock.call_count)
+        # Retry-After, then exponential backoff
+        self.assertEqual([((3.0,),), ((2,),)], sleep_mock.call_args_list)
+        self.assertEqual(0, client.limiter.in_flight)
+        # backed off to the min, then ramped after the success
+        self.assertEqual(2, client.limiter.limit)
+
+        # throttled until we run out of retries
+        sleep_mock.reset_mock()
+        with requests_mock() as mock:
+            mock.get(
+                ANY,
+                status_code=429,
+                headers={'Retry-After': 'Wed, 21 Oct 2026 07:28:00 GMT'},
+            )
+            with self.assertRaises(HTTPError) as ctx:
+                client.zone_get('unit.tests')
+            self.assertEqual(429, ctx.exception.response.status_code)
+            self.assertEqual(4, mock.call_count)
+        # unparsable Retry-After falls back to backoff
+        self.assertEqual([((1,),), ((2,),), ((4,),)], sleep_mock.call_args_list)
+
+        # a 503 to a POST may have been acted on, so it isn't retried, but
+        # it's still congestion
+        sleep_mock.reset_mock()
+        client.limiter.limit = 4
+        with requests_mock() as mock:
+            mock.post(ANY, status_code=503)
+            with self.assertRaises(HTTPError) as ctx:
+                client.record_create('unit.tests', 'www', 'A', {})
+            self.assertEqual(503, ctx.exception.response.status_code)
+            self.assertEqual(1, mock.call_count)
+        sleep_mock.assert_not_called()
+        self.assertEqual(2, client.limiter.limit)
+
+        # a 429 was rejected up front so it's safe to retry
+        with requests_mock() as mock:
+            mock.post(
+                ANY,
+                [
+                    {'status_code': 429, 'headers': {'Retry-After': '1'}},
+                    {'status_code': 201},
+                ],
+            )
+            client.record_create('unit.tests', 'www', 'A', {})
+            self.assertEqual(2, mock.call_count)
+
+        # whole zone transfers aren't used for latency baselines
+        with requests_mock() as mock:
+            mock.get(ANY, json={'recordsets': []})
+            client.zone_recordset_get('unit.tests')
+        self.assertNotIn('zone_recordset_get', client.limiter.baselines)
+        self.assertIn('record_create', client.limiter.baselines)
+
+        # connection failures release their slot
+        with requests_mock() as mock:
+            mock.get(ANY, exc=ConnectionError)
+            with self.assertRaises(ConnectionError):
+                client.zone_get('unit.tests')
+        self.assertEqual(0, client.limiter.in_flight)
+
     def test_apply_method_calls_zone_changelist_submit(self):
         comment = "Managed by OctoDNS."
         provider = AkamaiProvider(
@@ -221,4 +1379,4 @@ class TestEdgeDnsProvider(TestCase):
             ) as mock_zone_submit:
                 plan = provider.plan(self.expected)
                 provider._apply(plan)
-                mock_zone_submit.assert_called_once()
+                mock_zone_submit.assert_called_once_with("unit.tests", comment)